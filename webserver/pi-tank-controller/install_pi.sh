@@ -9,7 +9,11 @@ sudo apt update
 
 # Install system dependencies for camera and GPIO
 echo "Installing system dependencies..."
-sudo apt install -y python3-pip python3-venv libcamera-dev libcamera-tools
+sudo apt install -y python3-pip python3-venv libcamera-dev libcamera-tools libturbojpeg0 ffmpeg
+
+# pigpiod drives the crane servos with hardware-timed pulses (not available on every OS release)
+echo "Enabling pigpio daemon..."
+sudo apt install -y pigpio && sudo systemctl enable --now pigpiod || echo "pigpio not available, servos will use gpiozero"
 
 # Install uv (fast Python package installer)
 echo "Installing uv..."
@@ -1,153 +1,322 @@
-from flask import Flask, render_template, Response, request, jsonify
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from camera.stream import CameraStream
+from camera.h264 import H264Stream
 from gamepad.controller import GamepadController
 from tank.crane_control import CraneControl
+import anyio
+import asyncio
+import json
+import threading
 import signal
 import sys
-import os
-import time
+from pathlib import Path
+import uvicorn
 
-# Get the directory containing this script
-current_dir = os.path.dirname(os.path.abspath(__file__))
-# Go up one level to the pi-tank-controller directory
-project_root = os.path.dirname(current_dir)
+# The pi-tank-controller directory, one level up from this script
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+TEMPLATES_DIR = PROJECT_ROOT / 'templates'
+STATIC_DIR = PROJECT_ROOT / 'static'
 
-app = Flask(__name__, 
-           template_folder=os.path.join(project_root, 'templates'),
-           static_folder=os.path.join(project_root, 'static'))
+templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 # Initialize components
 camera_stream = CameraStream()
+h264_stream = H264Stream(camera_stream)
 crane_control = CraneControl()
 gamepad_controller = GamepadController(crane_control=crane_control)
 
-# Flag to prevent multiple starts
+# Multipart framing around each JPEG in the MJPEG stream
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_PART_TRAILER = b'\r\n'
+# Trailer of one part followed by the header of the next, sent as a single write
+MJPEG_PART_SEPARATOR = MJPEG_PART_TRAILER + MJPEG_PART_HEADER
+
+# Flag and lock to prevent multiple starts
 _components_started = False
+_components_closed = False
+_components_lock = threading.Lock()
+
+# Stream clients waiting for the next camera frame
+_frame_waiters = set()
+
+def _wake_frame_waiters():
+    """Resolve every pending frame wait, runs on the event loop"""
+    for waiter in _frame_waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+    _frame_waiters.clear()
+
+def start_components():
+    """Start camera and gamepad exactly once, however the app is served"""
+    global _components_started
+    with _components_lock:
+        if _components_started:
+            print("Components already started, skipping initialization...")
+            return
+        
+        # Start camera stream
+        camera_stream.start()
+        print("Camera stream started")
+        
+        # Start gamepad controller
+        gamepad_controller.start()
+        print("Gamepad controller started")
+        
+        _components_started = True
+
+def stop_components():
+    """Stop camera, gamepad and crane, safe to call more than once"""
+    global _components_started, _components_closed
+    with _components_lock:
+        if _components_closed:
+            return
+        try:
+            h264_stream.stop()
+            camera_stream.stop()
+        except Exception as e:
+            print(f"Error stopping camera: {e}")
+        try:
+            gamepad_controller.close()
+        except Exception as e:
+            print(f"Error closing gamepad: {e}")
+        try:
+            crane_control.close()
+        except Exception as e:
+            print(f"Error closing crane control: {e}")
+        
+        _components_started = False
+        _components_closed = True
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start the hardware and bridge new-frame notifications into the event loop"""
+    start_components()
+    loop = asyncio.get_running_loop()
+    listener = lambda: loop.call_soon_threadsafe(_wake_frame_waiters)
+    camera_stream.add_frame_listener(listener)
+    yield
+    camera_stream.remove_frame_listener(listener)
+    stop_components()
+
+app = FastAPI(lifespan=lifespan)
+app.mount('/static', StaticFiles(directory=str(STATIC_DIR)), name='static')
 
 def signal_handler(sig, frame):
     """Handle shutdown gracefully"""
     print('\nShutting down gracefully...')
-    camera_stream.stop()
-    gamepad_controller.close()
-    crane_control.close()
-    globals()['_components_started'] = False
+    stop_components()
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
 
-@app.route('/')
-def index():
+@app.get('/')
+async def index(request: Request):
     """Main page with camera stream and controls"""
-    return render_template('index.html')
+    return templates.TemplateResponse(request, 'index.html')
 
-def generate_frames():
+async def next_frame(last_id):
+    """Wait for a frame newer than last_id without holding a thread.
+    Frames published while a slow client is still sending are skipped, never queued."""
+    frame, frame_id = camera_stream.latest_frame()
+    while frame_id == last_id:
+        waiter = asyncio.get_running_loop().create_future()
+        _frame_waiters.add(waiter)
+        await waiter
+        frame, frame_id = camera_stream.latest_frame()
+    return frame, frame_id
+
+async def generate_frames():
     """Generate video frames for streaming"""
-    while True:
-        try:
-            frame = camera_stream.get_frame()
-            if frame and len(frame) > 0:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            else:
-                # If no frame is available, wait a bit and try again
-                time.sleep(0.1)
-        except Exception as e:
-            print(f"Error in generate_frames: {e}")
-            time.sleep(0.1)
+    last_id = 0
+    try:
+        # The JPEG is always its own chunk so it is never copied; the small
+        # trailer/header pair between frames goes out in one send instead of two
+        yield MJPEG_PART_HEADER
+        while True:
+            frame, last_id = await next_frame(last_id)
+            yield frame
+            yield MJPEG_PART_SEPARATOR
+    except Exception as e:
+        print(f"Error in generate_frames: {e}")
 
-@app.route('/video_feed')
-def video_feed():
+@app.get('/video_feed')
+async def video_feed():
     """Video streaming route"""
-    return Response(generate_frames(), 
-                   mimetype='multipart/x-mixed-replace; boundary=frame')
+    return StreamingResponse(generate_frames(),
+                             media_type='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/control', methods=['POST'])
-def control():
-    """Handle tank control commands from web interface"""
+async def generate_mp4():
+    """Register as a viewer, send the MP4 header then each new fragment, and always release the encoder.
+    Acquiring here rather than in the route means a viewer that never reads the body is never counted"""
+    # Shielded so a disconnect cannot cancel the await after the viewer was already counted
+    with anyio.CancelScope(shield=True):
+        acquired = await run_in_threadpool(h264_stream.acquire)
+    if not acquired:
+        # An empty body makes the page fall back to MJPEG
+        return
     try:
-        data = request.get_json()
-        command = data.get('command') if data else request.form.get('command')
-        
-        if command:
-            gamepad_controller.handle_command(command)
-            return jsonify({'status': 'success', 'command': command})
-        else:
-            return jsonify({'status': 'error', 'message': 'No command provided'}), 400
-            
+        init_segment = await run_in_threadpool(h264_stream.wait_init_segment, 5.0)
+        if init_segment is None:
+            return
+        yield init_segment
+        # Join at the newest fragment, every fragment starts with a keyframe
+        last_id = h264_stream.fragment_id - 1
+        while h264_stream.running:
+            fragments, last_id = await run_in_threadpool(h264_stream.wait_fragments, last_id, 1.0)
+            for fragment in fragments:
+                yield fragment
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        print(f"Error in generate_mp4: {e}")
+    finally:
+        # The response is being cancelled when the viewer disconnects, shield the release from that
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(h264_stream.release)
 
-@app.route('/status')
-def status():
-    """Get current system status"""
+@app.get('/video.mp4')
+async def video_mp4():
+    """H.264 stream as fragmented MP4, much lighter on wifi than /video_feed"""
+    if not h264_stream.available:
+        return JSONResponse({'status': 'error', 'message': 'H.264 streaming not available'}, status_code=503)
+    return StreamingResponse(generate_mp4(), media_type='video/mp4',
+                             headers={'Cache-Control': 'no-store'})
+
+@app.get('/snapshot')
+async def snapshot():
+    """Latest frame as a single JPEG, for clients that pull frames at their own pace"""
+    return Response(camera_stream.get_frame(), media_type='image/jpeg',
+                    headers={'Cache-Control': 'no-store'})
+
+async def _read_json(request):
+    """Parse a JSON request body, returns None when the body is missing or invalid"""
     try:
-        return jsonify({
-            'camera_streaming': camera_stream.is_streaming,
-            'gamepad_status': gamepad_controller.get_status()
-        })
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return await request.json()
+    except Exception:
+        return None
 
-@app.route('/gamepad_control', methods=['POST'])
-def gamepad_control():
-    """Handle direct gamepad input from web interface"""
+async def _run_control(kind, data):
+    """Run a 'cmd', 'crane' or 'sticks' control message, returns (body, HTTP status code)"""
     try:
-        data = request.get_json()
-        left_stick_y = data.get('left_stick_y', 0)
-        right_stick_y = data.get('right_stick_y', 0)
+        if kind == 'sticks':
+            left_stick_y = data.get('left_stick_y', 0)
+            right_stick_y = data.get('right_stick_y', 0)
+            await run_in_threadpool(gamepad_controller.motor_control.handle_gamepad_input,
+                                    left_stick_y, right_stick_y)
+            return {'status': 'success'}, 200
+        
+        if kind in ('cmd', 'crane'):
+            command = data.get('command')
+            if not command:
+                return {'status': 'error', 'message': 'No command provided'}, 400
+            # Crane moves are gradual, so keep all commands off the event loop
+            await run_in_threadpool(gamepad_controller.handle_command, command)
+            return {'status': 'success', 'command': command}, 200
         
-        gamepad_controller.motor_control.handle_gamepad_input(left_stick_y, right_stick_y)
-        return jsonify({'status': 'success'})
+        return {'status': 'error', 'message': f'Unknown kind: {kind}'}, 400
         
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return {'status': 'error', 'message': str(e)}, 500
 
-@app.route('/crane_control', methods=['POST'])
-def crane_control_endpoint():
-    """Handle crane and grabber control commands"""
+async def _dispatch_control(kind, data):
+    """HTTP wrapper around _run_control"""
+    body, status_code = await _run_control(kind, data)
+    if status_code != 200:
+        return JSONResponse(body, status_code=status_code)
+    return body
+
+@app.post('/api')
+async def api(request: Request):
+    """Single control endpoint, dispatches on the 'kind' field of the JSON body"""
+    data = await _read_json(request)
+    if not isinstance(data, dict):
+        return JSONResponse({'status': 'error', 'message': 'Invalid JSON body'}, status_code=400)
+    return await _dispatch_control(data.get('kind'), data)
+
+@app.post('/control')
+async def control(request: Request):
+    """Handle tank control commands from web interface"""
+    return await _dispatch_control('cmd', await _read_json(request) or {})
+
+def _system_status():
+    """Current camera and gamepad status"""
+    return {
+        'camera_streaming': camera_stream.is_streaming,
+        'camera_jpeg_quality': camera_stream.jpeg_quality,
+        'camera_reduced_resolution': camera_stream.reduced_resolution,
+        'gamepad_status': gamepad_controller.get_status()
+    }
+
+@app.get('/status')
+async def status():
+    """Get current system status"""
     try:
-        data = request.get_json()
-        command = data.get('command') if data else request.form.get('command')
-        
-        if command:
-            # Handle via gamepad controller which has crane control integration
-            success = gamepad_controller.handle_command(command)
-            return jsonify({'status': 'success', 'command': command})
-        else:
-            return jsonify({'status': 'error', 'message': 'No command provided'}), 400
-            
+        return _system_status()
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=500)
+
+@app.websocket('/ws')
+async def control_socket(websocket: WebSocket):
+    """Persistent control channel taking the same messages as /api, plus {'kind': 'status'}"""
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({'status': 'error', 'message': 'Invalid JSON'})
+                continue
+            if not isinstance(data, dict):
+                await websocket.send_json({'status': 'error', 'message': 'Invalid message'})
+                continue
+            
+            kind = data.get('kind')
+            if kind == 'status':
+                try:
+                    reply = _system_status()
+                except Exception as e:
+                    reply = {'status': 'error', 'message': str(e)}
+                reply['kind'] = 'status'
+                await websocket.send_json(reply)
+                continue
+            
+            body, status_code = await _run_control(kind, data)
+            # Stick updates arrive many times a second, only answer them when they fail
+            if kind != 'sticks' or status_code != 200:
+                await websocket.send_json(body)
+    except WebSocketDisconnect:
+        pass
+
+@app.post('/gamepad_control')
+async def gamepad_control(request: Request):
+    """Handle direct gamepad input from web interface"""
+    return await _dispatch_control('sticks', await _read_json(request) or {})
+
+@app.post('/crane_control')
+async def crane_control_endpoint(request: Request):
+    """Handle crane and grabber control commands"""
+    return await _dispatch_control('crane', await _read_json(request) or {})
 
-@app.route('/crane_status')
-def crane_status():
+@app.get('/crane_status')
+async def crane_status():
     """Get current crane and grabber status"""
     try:
-        status = crane_control.get_status()
-        return jsonify(status)
+        return crane_control.get_status()
     except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return JSONResponse({'status': 'error', 'message': str(e)}, status_code=500)
 
 if __name__ == '__main__':
     print("Starting Pi Tank Controller Web Server...")
     
     try:
-        # Only start components once
-        if not _components_started:
-            # Start camera stream
-            camera_stream.start()
-            print("Camera stream started")
-            
-            # Start gamepad controller
-            gamepad_controller.start()
-            print("Gamepad controller started")
-            
-            globals()['_components_started'] = True
-        else:
-            print("Components already started, skipping initialization...")
-
         print("Web server starting on http://0.0.0.0:5000")
-        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True, use_reloader=False)
+        # A single event loop serves every stream viewer; uvloop is used when installed.
+        # Long keep-alive lets the control POSTs reuse one connection per browser.
+        uvicorn.run(app, host='0.0.0.0', port=5000, workers=1, loop='auto',
+                    timeout_keep_alive=75, limit_concurrency=256)
         
     except Exception as e:
         print(f"Error starting web server: {e}")
@@ -155,17 +324,4 @@ if __name__ == '__main__':
         print("\nReceived shutdown signal")
     finally:
         print("Cleaning up...")
-        try:
-            camera_stream.stop()
-        except Exception as e:
-            print(f"Error stopping camera: {e}")
-        try:
-            gamepad_controller.close()
-        except Exception as e:
-            print(f"Error closing gamepad: {e}")
-        try:
-            crane_control.close()
-        except Exception as e:
-            print(f"Error closing crane control: {e}")
-        
-        globals()['_components_started'] = False
\ No newline at end of file
+        stop_components()
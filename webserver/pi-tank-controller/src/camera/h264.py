@@ -0,0 +1,177 @@
+import collections
+import shutil
+import struct
+import subprocess
+import threading
+from camera.stream import TARGET_FPS
+
+# H.264 stream settings, roughly a tenth of the MJPEG stream's bandwidth at 640x480
+H264_BITRATE = 1500000
+# Fragments kept for viewers that fall behind, about this many seconds at one keyframe per second
+H264_BACKLOG_FRAGMENTS = 4
+
+# Remux the encoder's raw H.264 into fragmented MP4 that browsers can play while it downloads
+FFMPEG_MP4_CMD = [
+    'ffmpeg', '-loglevel', 'error',
+    '-fflags', 'nobuffer', '-r', str(TARGET_FPS), '-f', 'h264', '-i', 'pipe:0',
+    '-c:v', 'copy', '-f', 'mp4',
+    '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+    'pipe:1',
+]
+
+class H264Stream:
+    """Hardware H.264 from the Pi camera as fragmented MP4, shared by every viewer"""
+    def __init__(self, camera_stream):
+        self.camera_stream = camera_stream
+        self.encoder = None
+        self.process = None
+        self.reader_thread = None
+        self.viewers = 0
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        # ftyp + moov boxes, sent to each viewer before any fragment
+        self.init_segment = None
+        # (fragment_id, moof + mdat bytes), each fragment starts on a keyframe
+        self.fragments = collections.deque(maxlen=H264_BACKLOG_FRAGMENTS)
+        self.fragment_id = 0
+
+    @property
+    def available(self):
+        """H.264 needs the Pi camera running on the hardware encoder path and ffmpeg installed"""
+        return self.camera_stream.use_hw_encoder and shutil.which('ffmpeg') is not None
+
+    def acquire(self):
+        """Register a viewer, starting the encoder and muxer for the first one; False on failure"""
+        with self.lock:
+            if self.process is None and not self._start():
+                return False
+            self.viewers += 1
+            return True
+
+    def release(self):
+        """Unregister a viewer, shutting everything down once the last one has gone"""
+        with self.lock:
+            self.viewers = max(0, self.viewers - 1)
+            if self.viewers == 0:
+                self._close()
+
+    def stop(self):
+        with self.lock:
+            self.viewers = 0
+            self._close()
+
+    def wait_init_segment(self, timeout=None):
+        """Block until the muxer has written the MP4 header, returns None on timeout or shutdown"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.init_segment is not None or self.process is None,
+                                    timeout=timeout)
+            return self.init_segment
+
+    def wait_fragments(self, last_id, timeout=None):
+        """Block for fragments newer than last_id, returns (fragments, newest_id); a lagging viewer skips ahead"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.fragment_id != last_id or self.process is None,
+                                    timeout=timeout)
+            fragments = [fragment for fragment_id, fragment in self.fragments if fragment_id > last_id]
+            return fragments, self.fragment_id
+
+    @property
+    def running(self):
+        """True while the encoder and muxer are up"""
+        return self.process is not None
+
+    def _start(self):
+        try:
+            from picamera2.encoders import H264Encoder
+            from picamera2.outputs import FileOutput
+            self.init_segment = None
+            self.fragments.clear()
+            self.process = subprocess.Popen(FFMPEG_MP4_CMD, stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self.reader_thread = threading.Thread(target=self._read_boxes, args=(self.process.stdout,))
+            self.reader_thread.daemon = True
+            self.reader_thread.start()
+            # Keyframe every second with SPS/PPS repeated, so each MP4 fragment stays short
+            self.encoder = H264Encoder(bitrate=H264_BITRATE, repeat=True, iperiod=TARGET_FPS)
+            # Runs alongside the MJPEG encoder on the same YUV420 stream
+            self.camera_stream.camera.start_encoder(self.encoder, FileOutput(self.process.stdin))
+            print("Hardware H.264 encoder started")
+            return True
+        except Exception as e:
+            print(f"Error starting H.264 stream: {e}")
+            self._close()
+            return False
+
+    def _read_boxes(self, stdout):
+        """Split the muxer's output into the init segment and moof+mdat fragments"""
+        header = []
+        pending = []
+        try:
+            while True:
+                box = self._read_box(stdout)
+                if box is None:
+                    break
+                box_type = box[4:8]
+                if box_type == b'moof':
+                    pending = [box]
+                elif box_type == b'mdat' and pending:
+                    pending.append(box)
+                    with self.condition:
+                        self.fragment_id += 1
+                        self.fragments.append((self.fragment_id, b''.join(pending)))
+                        self.condition.notify_all()
+                    pending = []
+                elif self.init_segment is None:
+                    header.append(box)
+                    if box_type == b'moov':
+                        with self.condition:
+                            self.init_segment = b''.join(header)
+                            self.condition.notify_all()
+        except Exception as e:
+            print(f"Error reading H.264 muxer output: {e}")
+        finally:
+            # Wake viewers so they notice the stream has ended
+            with self.condition:
+                self.condition.notify_all()
+
+    def _read_box(self, stdout):
+        """Read one whole MP4 box including its header, None at end of stream"""
+        header = stdout.read(8)
+        if len(header) < 8:
+            return None
+        size = struct.unpack('>I', header[:4])[0]
+        if size == 1:
+            # 64-bit size follows the type
+            extended = stdout.read(8)
+            if len(extended) < 8:
+                return None
+            header += extended
+            size = struct.unpack('>Q', extended)[0]
+        body = stdout.read(size - len(header))
+        if len(body) < size - len(header):
+            return None
+        return header + body
+
+    def _close(self):
+        if self.encoder:
+            try:
+                self.camera_stream.camera.stop_encoder(self.encoder)
+            except Exception as e:
+                print(f"Error stopping H.264 encoder: {e}")
+            self.encoder = None
+        if self.process:
+            try:
+                self.process.stdin.close()
+            except Exception:
+                pass
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            with self.condition:
+                self.process = None
+                self.condition.notify_all()
+        if self.reader_thread:
+            self.reader_thread.join(timeout=2)
+            self.reader_thread = None
@@ -1,78 +1,255 @@
-import cv2
+import io
+import queue
 import threading
 import time
-from io import BytesIO
-import numpy as np
+
+# Stream settings shared by every camera backend
+FRAME_W = 640
+FRAME_H = 480
+JPEG_Q = 70
+JPEG_CHROMA_Q = 60
+TARGET_FPS = 30
+# Hardware MJPEG bitrate, about 33 KB per frame at TARGET_FPS, close to a JPEG_Q software frame
+MJPEG_BITRATE = 8000000
+# Software JPEG encoders running in parallel, libjpeg releases the GIL so they use separate cores
+ENCODE_WORKERS = 2
+
+# Software encoding falls back to this size when it cannot keep up with TARGET_FPS
+REDUCED_FRAME_W = 480
+REDUCED_FRAME_H = 360
+OVER_BUDGET_SECONDS = 2.0
+
+# Software JPEG quality adapts to encode time within these bounds, one step at most per interval.
+# It never climbs past JPEG_Q, which keeps the MJPEG stream within its Wi-Fi bandwidth
+JPEG_Q_MIN = 40
+JPEG_Q_MAX = JPEG_Q
+JPEG_Q_STEP = 5
+JPEG_Q_ADJUST_SECONDS = 1.0
+
+# Rows at the top of the dummy frame that hold the timestamp
+DUMMY_TIMESTAMP_ROWS = 40
+
+# OpenCV, numpy and the JPEG encoders are only imported once software encoding
+# is actually needed, so the Pi camera's hardware encoder path never loads them
+_jpeg_encoder_loaded = False
+_simplejpeg = None
+_turbojpeg = None
+_turbojpeg_subsample = None
+_jpeg_params = None
+
+def _load_jpeg_encoder():
+    """Prefer a libjpeg-turbo binding, they are several times faster than OpenCV's JPEG path"""
+    global _jpeg_encoder_loaded, _simplejpeg, _turbojpeg, _turbojpeg_subsample, _jpeg_params
+    import cv2
+    # Baseline 4:2:0 JPEG tuned for live streaming over Wi-Fi, built once for the hot path
+    _jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_Q,
+                    cv2.IMWRITE_JPEG_CHROMA_QUALITY, JPEG_CHROMA_Q,
+                    cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+                    cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+    try:
+        # Ships with picamera2; a numpy ABI mismatch surfaces here as a ValueError
+        import simplejpeg
+        _simplejpeg = simplejpeg
+    except Exception as e:
+        print(f"simplejpeg not available: {e}")
+        try:
+            from turbojpeg import TurboJPEG, TJSAMP_420
+            _turbojpeg = TurboJPEG()
+            _turbojpeg_subsample = TJSAMP_420
+        except Exception as e:
+            print(f"PyTurboJPEG not available, using OpenCV JPEG encoding: {e}")
+    _jpeg_encoder_loaded = True
+
+def _encode_jpeg(image, quality=JPEG_Q):
+    """Encode a BGR image as JPEG, returns bytes"""
+    if not _jpeg_encoder_loaded:
+        _load_jpeg_encoder()
+    if _simplejpeg is not None:
+        try:
+            return _simplejpeg.encode_jpeg(image, quality=quality, colorspace='BGR',
+                                           colorsubsampling='420', fastdct=True)
+        except ValueError:
+            # simplejpeg rejects non-contiguous arrays such as padded camera buffers
+            pass
+    elif _turbojpeg is not None:
+        return _turbojpeg.encode(image, quality=quality, jpeg_subsample=_turbojpeg_subsample)
+    import cv2
+    params = _jpeg_params
+    if quality != JPEG_Q:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality,
+                  cv2.IMWRITE_JPEG_CHROMA_QUALITY, min(JPEG_CHROMA_Q, quality),
+                  cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+                  cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+    _, jpeg = cv2.imencode('.jpg', image, params)
+    # Starlette only sends bytes bodies as-is, so the small JPEG is copied out of OpenCV's array
+    return jpeg.tobytes()
+
+def _encode_jpeg_unconverted(frame, width=None, quality=JPEG_Q):
+    """Encode RGBX or planar I420 frames with no colour conversion pass, None if that isn't possible"""
+    if not _jpeg_encoder_loaded:
+        _load_jpeg_encoder()
+    if _simplejpeg is None:
+        return None
+    try:
+        if frame.ndim == 3 and frame.shape[2] == 4:
+            # "XBGR8888" is laid out R, G, B, X, which libjpeg-turbo reads directly
+            return _simplejpeg.encode_jpeg(frame, quality=quality, colorspace='RGBX',
+                                           colorsubsampling='420', fastdct=True)
+        if frame.ndim == 2:
+            # I420 is already the YCbCr 4:2:0 a JPEG stores, hand the planes straight over
+            h = frame.shape[0] * 2 // 3
+            stride = frame.shape[1]
+            y = frame[:h]
+            u = frame[h:h + h // 4].reshape(h // 2, stride // 2)
+            v = frame[h + h // 4:].reshape(h // 2, stride // 2)
+            if width and width < stride:
+                import numpy as np
+                # Drop the padding the ISP adds to keep each line aligned
+                y = np.ascontiguousarray(y[:, :width])
+                u = np.ascontiguousarray(u[:, :width // 2])
+                v = np.ascontiguousarray(v[:, :width // 2])
+            return _simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=quality, fastdct=True)
+    except ValueError:
+        pass
+    return None
+
+# Pi camera configurations from best to most basic, for compatibility with older libcamera stacks.
+# The video configuration in YUV420 feeds the hardware MJPEG encoder directly; the last entry
+# uses the camera as-is without calling configure at all
+PI_CAMERA_CONFIGS = [
+    ('video', lambda camera: camera.create_video_configuration(
+        main={"size": (FRAME_W, FRAME_H), "format": "YUV420"})),
+    ('basic preview', lambda camera: camera.create_preview_configuration()),
+    ('preview with size', lambda camera: camera.create_preview_configuration(
+        main={"size": (FRAME_W, FRAME_H)})),
+    ('still', lambda camera: camera.create_still_configuration()),
+    ('minimal', None),
+]
+
+# Camera backend found by the first CameraStream, so later instances skip the probing:
+# ('picamera2', config name), ('opencv', camera index) or ('dummy', None)
+_detected_backend = None
+
+# Minimal valid black 8x8 JPEG, stored as bytes so it needs no encoder at startup
+MINIMAL_JPEG = bytes.fromhex(
+    'ffd8ffe000104a46494600010100000100010000ffdb0043000201010101010201010102'
+    '020202020403020202020504040304060506060605060606070908060709070606080b08'
+    '090a0a0a0a0a06080b0c0b0a0c090a0a0affc0000b080008000801011100ffc4001f0000'
+    '010501010101010100000000000000000102030405060708090a0bffc400b51000020103'
+    '03020403050504040000017d01020300041105122131410613516107227114328191a108'
+    '2342b1c11552d1f02433627282090a161718191a25262728292a3435363738393a434445'
+    '464748494a535455565758595a636465666768696a737475767778797a83848586878889'
+    '8a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9'
+    'cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda00080101'
+    '00003f00fe7febffd9'
+)
+
+class StreamingOutput(io.BufferedIOBase):
+    """Receives ready-made JPEG frames from the Pi's hardware MJPEG encoder"""
+    def __init__(self, publish):
+        self.publish = publish
+
+    def write(self, buf):
+        self.publish(buf)
 
 class CameraStream:
     def __init__(self):
         self.camera = None
         self.is_streaming = False
-        self.frame = None
-        self.lock = threading.Lock()
+        # Set by stop() so waits in the capture thread end immediately
+        self._stop_event = threading.Event()
+        # (jpeg_bytes, frame_id) - replaced as one object so readers never need a lock
+        self._latest = (b'', 0)
+        self.condition = threading.Condition()
+        self._blocking_waiters = 0
+        self.frame_listeners = []
         self.thread = None
+        self.encode_threads = []
+        # Raw frames waiting for an encoder, tagged with a sequence number to keep output in order
+        self._raw_q = queue.Queue(maxsize=ENCODE_WORKERS)
+        self._capture_seq = 0
+        self._published_seq = 0
+        self._publish_lock = threading.Lock()
+        # USB frames the encoders are done with, read() fills them again instead of allocating
+        self._free_frames = queue.SimpleQueue()
+        # Pixel width of Pi camera frames, which may be narrower than the buffer's line stride
+        self._capture_width = None
+        # Encode-time feedback used to drop resolution when the CPU can't keep up
+        self._encode_ema = 0.0
+        self._over_budget_since = None
+        self._reduce_resolution = False
+        self.jpeg_quality = JPEG_Q
+        self._quality_adjusted_at = 0.0
+        self.reduced_resolution = False
         self.use_fallback = False
+        self.use_hw_encoder = False
+        self.output = StreamingOutput(self._publish_frame)
+        self._dummy_jpeg = None
+        self._dummy_second = None
+        self._dummy_base = None
+        self._dummy_img = None
         
-        # Try to initialize Pi camera first
-        try:
-            from picamera2 import Picamera2
-            self.camera = Picamera2()
-            
-            # Try different configuration approaches for compatibility
+        # Probe for a camera; after the first instance the backend that worked is tried directly
+        backend, detail = _detected_backend or (None, None)
+        if backend in (None, 'picamera2'):
             try:
-                # First try the most basic configuration without specifying format/size
-                print("Trying basic preview configuration...")
-                camera_config = self.camera.create_preview_configuration()
-                self.camera.configure(camera_config)
-                print("Pi Camera initialized successfully (basic configuration)")
-            except Exception as basic_error:
-                print(f"Basic configuration failed: {basic_error}")
-                try:
-                    # Try with specific size but no format
-                    print("Trying preview configuration with size...")
-                    camera_config = self.camera.create_preview_configuration(
-                        main={"size": (640, 480)}
-                    )
-                    self.camera.configure(camera_config)
-                    print("Pi Camera initialized successfully (size configuration)")
-                except Exception as size_error:
-                    print(f"Size configuration failed: {size_error}")
-                    try:
-                        # Try still configuration as fallback
-                        print("Trying still configuration...")
-                        camera_config = self.camera.create_still_configuration()
-                        self.camera.configure(camera_config)
-                        print("Pi Camera initialized successfully (still configuration)")
-                    except Exception as still_error:
-                        print(f"Still configuration failed: {still_error}")
-                        # Try to configure with minimal setup
-                        try:
-                            print("Trying minimal configuration...")
-                            # Don't call configure, just try to use the camera as-is
-                        except Exception as minimal_error:
-                            print(f"Minimal configuration also failed: {minimal_error}")
-                            raise minimal_error
-                    
-        except ImportError as e:
-            print(f"Pi Camera not available (libcamera missing): {e}")
-            self._init_fallback_camera()
-        except Exception as e:
-            print(f"Error initializing Pi Camera: {e}")
-            self._init_fallback_camera()
+                self._init_pi_camera(detail)
+            except ImportError as e:
+                print(f"Pi Camera not available (libcamera missing): {e}")
+                self._init_fallback_camera()
+            except Exception as e:
+                print(f"Error initializing Pi Camera: {e}")
+                self._init_fallback_camera()
+        elif backend == 'opencv':
+            self._init_fallback_camera(detail)
+        else:
+            print("No working camera found earlier - using dummy frames")
+        
+        # Publish a placeholder right away so get_frame() never returns an empty frame;
+        # the Pi camera gets a plain black one so startup doesn't have to load OpenCV
+        if self.camera and not self.use_fallback:
+            self._publish_frame(MINIMAL_JPEG)
+        else:
+            self._generate_dummy_frame()
+
+    def _init_pi_camera(self, config_name=None):
+        """Open the Pi camera with the first configuration that works, starting with config_name"""
+        global _detected_backend
+        from picamera2 import Picamera2
+        self.camera = Picamera2()
+        
+        # Stable sort, so a previously successful configuration goes first and the rest keep their order
+        for name, make_config in sorted(PI_CAMERA_CONFIGS, key=lambda config: config[0] != config_name):
+            try:
+                print(f"Trying {name} configuration...")
+                if make_config is not None:
+                    self.camera.configure(make_config(self.camera))
+                print(f"Pi Camera initialized successfully ({name} configuration)")
+                _detected_backend = ('picamera2', name)
+                return
+            except Exception as e:
+                print(f"{name} configuration failed: {e}")
+        raise RuntimeError("no Pi camera configuration worked")
     
-    def _init_fallback_camera(self):
-        """Initialize fallback camera using OpenCV"""
+    def _init_fallback_camera(self, preferred_index=None):
+        """Initialize fallback camera using OpenCV, trying preferred_index first"""
+        global _detected_backend
         try:
+            import cv2
             # Try multiple camera indices (0, 1, 2) as different systems may have different camera assignments
-            for camera_index in [0, 1, 2]:
+            camera_indices = [0, 1, 2]
+            if preferred_index is not None:
+                camera_indices.remove(preferred_index)
+                camera_indices.insert(0, preferred_index)
+            for camera_index in camera_indices:
                 print(f"Trying camera index {camera_index}...")
                 self.camera = cv2.VideoCapture(camera_index)
                 
                 if self.camera.isOpened():
                     # Set camera properties before testing
-                    self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                    self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                    self.camera.set(cv2.CAP_PROP_FPS, 30)
+                    self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_W)
+                    self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_H)
+                    self.camera.set(cv2.CAP_PROP_FPS, TARGET_FPS)
                     
                     # Test if we can actually read a frame
                     print(f"Testing frame read from camera {camera_index}...")
@@ -81,6 +258,7 @@ class CameraStream:
                     if ret and test_frame is not None and test_frame.size > 0:
                         print(f"USB camera {camera_index} initialized successfully")
                         self.use_fallback = True
+                        _detected_backend = ('opencv', camera_index)
                         return
                     else:
                         print(f"Camera {camera_index} opened but cannot read frames (ret={ret})")
@@ -93,6 +271,7 @@ class CameraStream:
             
             # If we get here, no cameras worked
             self.camera = None
+            _detected_backend = ('dummy', None)
             print("No working camera found - using dummy frames")
             
         except Exception as e:
@@ -107,18 +286,25 @@ class CameraStream:
         if not self.is_streaming:
             try:
                 print("Starting camera stream...")
-                # Generate initial dummy frame to ensure get_frame() always returns something
-                self._generate_dummy_frame()
-                
-                if self.camera:
-                    if not self.use_fallback:
-                        # Pi camera
+                if self.camera and not self.use_fallback:
+                    # Pi camera - let the GPU produce JPEGs, fall back to software encoding
+                    self.use_hw_encoder = self._start_hw_encoder()
+                    if not self.use_hw_encoder:
+                        self._configure_software_capture()
                         self.camera.start()
-                    # OpenCV camera is already "started" when opened
+                # OpenCV camera is already "started" when opened
+                self._stop_event.clear()
                 self.is_streaming = True
-                self.thread = threading.Thread(target=self._capture_frames)
-                self.thread.daemon = True
-                self.thread.start()
+                if not self.use_hw_encoder:
+                    self.encode_threads = []
+                    for _ in range(ENCODE_WORKERS):
+                        encode_thread = threading.Thread(target=self._encode_frames)
+                        encode_thread.daemon = True
+                        encode_thread.start()
+                        self.encode_threads.append(encode_thread)
+                    self.thread = threading.Thread(target=self._capture_frames)
+                    self.thread.daemon = True
+                    self.thread.start()
                 print("Camera stream started successfully")
             except Exception as e:
                 print(f"Error starting camera: {e}")
@@ -126,16 +312,57 @@ class CameraStream:
                 # Ensure we have at least a dummy frame
                 self._generate_dummy_frame()
 
+    def _start_hw_encoder(self):
+        """Start the Pi's hardware MJPEG encoder, returns True on success"""
+        try:
+            from picamera2.encoders import MJPEGEncoder
+            from picamera2.outputs import FileOutput
+            self.camera.start_recording(MJPEGEncoder(bitrate=MJPEG_BITRATE), FileOutput(self.output))
+            print("Hardware MJPEG encoder started")
+            return True
+        except Exception as e:
+            print(f"Hardware MJPEG encoder not available, using software encoding: {e}")
+            return False
+
+    def _configure_software_capture(self, size=(FRAME_W, FRAME_H)):
+        """Reconfigure the Pi camera to deliver frames the software encoder needs no conversion for"""
+        if not _jpeg_encoder_loaded:
+            _load_jpeg_encoder()
+        # simplejpeg takes YUV420 planes as-is: half the bytes of BGR and no colour conversion.
+        # Otherwise Picamera2's "RGB888", which is laid out B, G, R - OpenCV's native order
+        pixel_format = "YUV420" if _simplejpeg is not None else "RGB888"
+        try:
+            camera_config = self.camera.create_video_configuration(
+                main={"size": size, "format": pixel_format}
+            )
+            self.camera.configure(camera_config)
+            self._capture_width = size[0]
+            print(f"Pi Camera configured for {pixel_format} capture")
+        except Exception as e:
+            print(f"{pixel_format} configuration failed, keeping current configuration: {e}")
+
     def stop(self):
         if self.is_streaming:
             self.is_streaming = False
+            self._stop_event.set()
             if self.thread:
                 self.thread.join()
+            if self.encode_threads:
+                # Wake each encoder with a sentinel so it can exit; being the newest
+                # entries, the sentinels are never the ones dropped from the queue
+                for _ in self.encode_threads:
+                    self._offer_raw_frame(None)
+                for encode_thread in self.encode_threads:
+                    encode_thread.join()
+                self.encode_threads = []
             if self.camera:
                 try:
                     if self.use_fallback:
                         # OpenCV camera
                         self.camera.release()
+                    elif self.use_hw_encoder:
+                        # Pi camera with hardware encoder
+                        self.camera.stop_recording()
                     else:
                         # Pi camera
                         self.camera.stop()
@@ -144,27 +371,28 @@ class CameraStream:
                     print(f"Error stopping camera: {e}")
 
     def _capture_frames(self):
-        """Capture frames in a separate thread"""
+        """Capture raw frames in a separate thread, JPEG encoding runs in _encode_frames"""
         print(f"Starting frame capture thread, use_fallback={self.use_fallback}, camera={self.camera is not None}")
         
+        # Camera reads block until the next frame, so the loop runs at the sensor's pace
         while self.is_streaming:
             try:
+                if self._reduce_resolution and not self.reduced_resolution:
+                    self._apply_reduced_resolution()
+                
                 if self.camera:
                     if self.use_fallback:
                         # OpenCV camera
-                        ret, frame_bgr = self.camera.read()
+                        ret, frame_bgr = self.camera.read(self._take_free_frame())
                         if ret:
-                            # Encode frame as JPEG
-                            _, jpeg = cv2.imencode('.jpg', frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                            
-                            with self.lock:
-                                self.frame = jpeg.tobytes()
+                            self._offer_raw_frame(frame_bgr)
                         else:
                             print(f"Failed to read frame from USB camera, ret={ret}")
                             # Fall back to dummy frame if camera read fails
                             self._generate_dummy_frame()
+                            self._stop_event.wait(0.1)
                     else:
-                        # Pi camera
+                        # Pi camera without hardware encoder
                         try:
                             frame_array = self.camera.capture_array()
                             
@@ -172,71 +400,237 @@ class CameraStream:
                             if frame_array is None:
                                 raise Exception("capture_array() returned None")
                             
-                            # Check if it's already in BGR format or needs conversion
-                            if len(frame_array.shape) == 3 and frame_array.shape[2] == 3:
-                                # Assume RGB format and convert to BGR for OpenCV
-                                frame_bgr = cv2.cvtColor(frame_array, cv2.COLOR_RGB2BGR)
-                            elif len(frame_array.shape) == 3 and frame_array.shape[2] == 4:
-                                # RGBA format, convert to BGR
-                                frame_bgr = cv2.cvtColor(frame_array, cv2.COLOR_RGBA2BGR)
-                            else:
-                                # Unknown format, try to use as-is
-                                frame_bgr = frame_array
-                            
-                            # Encode frame as JPEG
-                            _, jpeg = cv2.imencode('.jpg', frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                            
-                            with self.lock:
-                                self.frame = jpeg.tobytes()
+                            self._offer_raw_frame(frame_array)
                         except Exception as picam_error:
                             print(f"Pi Camera capture error: {picam_error}")
                             # Fall back to dummy frame if Pi camera fails
                             self._generate_dummy_frame()
+                            self._stop_event.wait(0.1)
                 else:
-                    # No camera - generate dummy frame
+                    # No camera - the dummy frame only changes once a second
                     self._generate_dummy_frame()
-                    
-                time.sleep(0.033)  # ~30 FPS
+                    self._stop_event.wait(1.0)
             except Exception as e:
                 print(f"Error capturing frame: {e}")
                 # Generate dummy frame on error
                 self._generate_dummy_frame()
-                time.sleep(0.1)
+                self._stop_event.wait(0.1)
+
+    def _apply_reduced_resolution(self):
+        """Switch the capture size down to REDUCED_FRAME_W x REDUCED_FRAME_H"""
+        print(f"Encoding is slower than {TARGET_FPS} FPS, reducing resolution to "
+              f"{REDUCED_FRAME_W}x{REDUCED_FRAME_H}")
+        self.reduced_resolution = True
+        try:
+            if self.use_fallback:
+                import cv2
+                self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, REDUCED_FRAME_W)
+                self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, REDUCED_FRAME_H)
+            else:
+                self.camera.stop()
+                self._configure_software_capture((REDUCED_FRAME_W, REDUCED_FRAME_H))
+                self.camera.start()
+        except Exception as e:
+            print(f"Error reducing camera resolution: {e}")
+
+    def _track_encode_time(self, encode_time):
+        """Adapt JPEG quality to encode time, and ask for a lower resolution once encoding stays over budget"""
+        self._encode_ema = 0.9 * self._encode_ema + 0.1 * encode_time
+        # With several encoders in parallel each one gets that many frame intervals per frame
+        budget = ENCODE_WORKERS / TARGET_FPS
+        now = time.monotonic()
+        
+        # Trade quality for speed before resolution: step down when near the budget, back up when idle
+        if now - self._quality_adjusted_at > JPEG_Q_ADJUST_SECONDS:
+            if self._encode_ema > 0.75 * budget and self.jpeg_quality > JPEG_Q_MIN:
+                self.jpeg_quality = max(JPEG_Q_MIN, self.jpeg_quality - JPEG_Q_STEP)
+                self._quality_adjusted_at = now
+            elif self._encode_ema < 0.4 * budget and self.jpeg_quality < JPEG_Q_MAX:
+                self.jpeg_quality = min(JPEG_Q_MAX, self.jpeg_quality + JPEG_Q_STEP)
+                self._quality_adjusted_at = now
+        
+        if self._encode_ema <= budget:
+            self._over_budget_since = None
+            return
+        if self._over_budget_since is None:
+            self._over_budget_since = now
+        elif now - self._over_budget_since > OVER_BUDGET_SECONDS:
+            self._reduce_resolution = True
+
+    def _offer_raw_frame(self, frame_array):
+        """Hand a raw frame to the encoder threads, replacing the oldest one not picked up yet"""
+        if frame_array is None:
+            item = None
+        else:
+            self._capture_seq += 1
+            item = (self._capture_seq, frame_array)
+        try:
+            self._raw_q.put_nowait(item)
+        except queue.Full:
+            try:
+                dropped = self._raw_q.get_nowait()
+                if dropped is not None:
+                    self._recycle_frame(dropped[1])
+            except queue.Empty:
+                pass
+            self._raw_q.put_nowait(item)
+
+    def _take_free_frame(self):
+        """A spent USB frame buffer to read into, or None to let OpenCV allocate one"""
+        try:
+            return self._free_frames.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _recycle_frame(self, frame_array):
+        """Return a USB frame buffer once nothing reads it any more"""
+        # Picamera2 hands out a new array per capture, only OpenCV's read() can refill one
+        if self.use_fallback:
+            self._free_frames.put(frame_array)
+
+    def _encode_frames(self):
+        """Encode raw frames to JPEG on a separate thread so capture and encode overlap"""
+        import cv2
+        # The encoders already run one per core; OpenCV's own worker pool would only compete
+        cv2.setNumThreads(1)
+        # Conversion target reused by this encoder instead of a fresh array per frame
+        bgr_buf = None
+        while True:
+            item = self._raw_q.get()
+            if item is None:
+                break
+            seq, frame_array = item
+            try:
+                started = time.perf_counter()
+                
+                # Check if it's already in BGR format or needs conversion
+                if len(frame_array.shape) == 3 and frame_array.shape[2] == 3:
+                    # USB and "RGB888" frames are already in OpenCV's BGR order
+                    jpeg = _encode_jpeg(frame_array, self.jpeg_quality)
+                else:
+                    # RGBX and YUV420 can usually skip the conversion to BGR entirely
+                    jpeg = _encode_jpeg_unconverted(frame_array, self._capture_width, self.jpeg_quality)
+                
+                if jpeg is None:
+                    if len(frame_array.shape) == 3 and frame_array.shape[2] == 4:
+                        # RGBA format, convert to BGR
+                        frame_bgr = bgr_buf = cv2.cvtColor(frame_array, cv2.COLOR_RGBA2BGR, dst=bgr_buf)
+                    elif len(frame_array.shape) == 2:
+                        # Planar YUV420 from the video configuration
+                        frame_bgr = bgr_buf = cv2.cvtColor(frame_array, cv2.COLOR_YUV2BGR_I420, dst=bgr_buf)
+                    else:
+                        # Unknown format, try to use as-is
+                        frame_bgr = frame_array
+                    jpeg = _encode_jpeg(frame_bgr, self.jpeg_quality)
+                
+                # Another encoder may have finished a newer frame first, never go back in time
+                with self._publish_lock:
+                    if seq > self._published_seq:
+                        self._published_seq = seq
+                        self._publish_frame(jpeg)
+                self._track_encode_time(time.perf_counter() - started)
+            except Exception as e:
+                print(f"Error encoding frame: {e}")
+                self._generate_dummy_frame()
+            # The JPEG never references the raw frame, so its buffer can be refilled now
+            self._recycle_frame(frame_array)
     
     def _generate_dummy_frame(self):
         """Generate a dummy frame when no camera is available"""
         try:
-            # Create a 640x480 image with text
-            img = np.zeros((480, 640, 3), dtype=np.uint8)
-            img.fill(50)  # Dark gray background
-            
-            # Add text
-            text = "No Camera Available"
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            text_size = cv2.getTextSize(text, font, 1, 2)[0]
-            text_x = (img.shape[1] - text_size[0]) // 2
-            text_y = (img.shape[0] + text_size[1]) // 2
-            
-            cv2.putText(img, text, (text_x, text_y), font, 1, (255, 255, 255), 2)
-            
-            # Add timestamp
-            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            cv2.putText(img, timestamp, (10, 30), font, 0.7, (200, 200, 200), 1)
-            
-            # Encode as JPEG
-            _, jpeg = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            # Only the timestamp changes, so re-render at most once per second
+            now = int(time.time())
+            if now != self._dummy_second:
+                import cv2
+                font = cv2.FONT_HERSHEY_SIMPLEX
+                if self._dummy_base is None:
+                    import numpy as np
+                    # Create a frame-sized image with text, drawn once
+                    img = np.zeros((FRAME_H, FRAME_W, 3), dtype=np.uint8)
+                    img.fill(50)  # Dark gray background
+                    
+                    # Add text
+                    text = "No Camera Available"
+                    text_size = cv2.getTextSize(text, font, 1, 2)[0]
+                    text_x = (img.shape[1] - text_size[0]) // 2
+                    text_y = (img.shape[0] + text_size[1]) // 2
+                    
+                    cv2.putText(img, text, (text_x, text_y), font, 1, (255, 255, 255), 2)
+                    self._dummy_base = img
+                    self._dummy_img = img.copy()
+                
+                # Restore only the timestamp strip from the base image, then redraw it
+                img = self._dummy_img
+                img[:DUMMY_TIMESTAMP_ROWS] = self._dummy_base[:DUMMY_TIMESTAMP_ROWS]
+                timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+                cv2.putText(img, timestamp, (10, 30), font, 0.7, (200, 200, 200), 1)
+                
+                # Encode as JPEG
+                self._dummy_jpeg = _encode_jpeg(img)
+                self._dummy_second = now
             
-            with self.lock:
-                self.frame = jpeg.tobytes()
+            # Clients only need waking when the dummy frame actually changed
+            if self._latest[0] is not self._dummy_jpeg:
+                self._publish_frame(self._dummy_jpeg)
         except Exception as e:
             print(f"Error generating dummy frame: {e}")
-            # Create minimal valid JPEG frame
-            with self.lock:
-                # Create a minimal black image
-                minimal_img = np.zeros((100, 200, 3), dtype=np.uint8)
-                _, minimal_jpeg = cv2.imencode('.jpg', minimal_img)
-                self.frame = minimal_jpeg.tobytes()
-
-    def get_frame(self):
-        with self.lock:
-            return self.frame if self.frame is not None else b''
\ No newline at end of file
+            self._publish_frame(MINIMAL_JPEG)
+
+    def _publish_frame(self, frame):
+        """Store a new JPEG frame and wake every client waiting for it"""
+        # A single attribute assignment, readers just pick up the new tuple without locking
+        self._latest = (frame, self._latest[1] + 1)
+        # Only blocking wait_frame() callers need the condition, skip it when there are none
+        if self._blocking_waiters:
+            with self.condition:
+                self.condition.notify_all()
+        for listener in self.frame_listeners:
+            listener()
+
+    def add_frame_listener(self, listener):
+        """Call listener() from the capture thread whenever a new frame is published"""
+        self.frame_listeners.append(listener)
+
+    def remove_frame_listener(self, listener):
+        if listener in self.frame_listeners:
+            self.frame_listeners.remove(listener)
+
+    @property
+    def frame_id(self):
+        return self._latest[1]
+
+    def get_frame(self, wait=False, timeout=None):
+        """Latest JPEG, never empty; wait=True blocks for the next one (up to timeout) instead.
+        Every caller gets the published bytes object itself, never a copy"""
+        if wait:
+            latest = self.wait_frame(self._latest[1], timeout=timeout)
+            if latest is not None:
+                return latest[0]
+        return self._latest[0]
+
+    def latest_frame(self):
+        """Return the current frame together with its frame_id"""
+        return self._latest
+
+    def wait_frame(self, last_id, timeout=None):
+        """Block until a frame newer than last_id exists, returns (frame, frame_id) or None on timeout"""
+        with self.condition:
+            # Register before checking so a publisher either sees us or we see its frame
+            self._blocking_waiters += 1
+            try:
+                if not self.condition.wait_for(lambda: self._latest[1] != last_id, timeout=timeout):
+                    return None
+            finally:
+                self._blocking_waiters -= 1
+        # Always the newest frame, anything published meanwhile is skipped
+        return self._latest
+
+    def frames(self):
+        """Yield each new frame as it arrives; a slow client skips to the latest one"""
+        last_id = 0
+        while True:
+            latest = self.wait_frame(last_id, timeout=1.0)
+            if latest is None:
+                continue
+            frame, last_id = latest
+            yield frame
@@ -1,12 +1,42 @@
-import pygame
+import math
+import os
+import select
 import threading
 import time
 from tank.motor_control import TankMotorControl
 from tank.crane_control import CraneControl
+from tank.realtime import set_realtime_priority
+from tank.error_report import ErrorReporter
+
+# evdev reads the gamepad straight from /dev/input without SDL; pygame is only
+# loaded when evdev is missing (non-Linux) or finds no gamepad
+try:
+    from evdev import InputDevice, ecodes, list_devices
+except ImportError:
+    InputDevice = None
+
+# Buttons listed in get_status, enough for common gamepads
+MAX_BUTTONS = 16
+
+# Longest the input thread sleeps waiting for a gamepad event, in milliseconds
+INPUT_WAIT_MS = 100
+# While a stick is held off-centre the track speeds are re-sent this often even if
+# they have not changed, in milliseconds
+DRIVE_RESEND_MS = 500
+# Smallest track speed change worth a motor write
+MOTOR_UPDATE_THRESHOLD = 0.02
 
 class GamepadController:
+    __slots__ = (
+        'motor_control', 'crane_control', 'running', 'thread', 'gamepad',
+        'gamepad_name', 'backend', 'pygame_initialized', 'buttons_held', 'axis_states',
+        'deadzone', 'input_latency_ms', '_commands', '_axis_values', '_evdev_axes',
+        '_evdev_buttons', '_left_x_axis', '_left_y_axis', '_right_y_axis',
+        '_mix_sticks', '_driving', '_last_drive', '_last_sent', '_report_error', '_state_lock', '_inv_one_minus_dz',
+    )
+
     def __init__(self, crane_control=None):
-        """Initialize gamepad controller with pygame"""
+        """Initialize gamepad controller with evdev, or pygame where evdev is unavailable"""
         self.motor_control = TankMotorControl()
         
         # Use provided crane control or create new one if none provided
@@ -15,24 +45,118 @@ class GamepadController:
         else:
             from tank.crane_control import CraneControl
             self.crane_control = CraneControl()
+        
+        # Web command name -> action, looked up once per command
+        motor_control = self.motor_control
+        crane_control = self.crane_control
+        self._commands = {
+            # Tank movement commands
+            'forward': motor_control.move_forward,
+            'backward': motor_control.move_backward,
+            'left': motor_control.turn_left,
+            'right': motor_control.turn_right,
+            'stop': motor_control.stop,
+            # Crane and grabber commands
+            'crane_up': crane_control.lift_crane,
+            'crane_down': crane_control.lower_crane,
+            'grabber_open': crane_control.open_grabber,
+            'grabber_close': crane_control.close_grabber,
+            'grabber_toggle': crane_control.toggle_grabber,
+            'crane_stop': crane_control.stop_crane,
+            'grabber_stop': crane_control.stop_grabber,
+        }
             
         self.running = False
         self.thread = None
         self.gamepad = None
+        self.gamepad_name = None
+        self.backend = None
         self.pygame_initialized = False
+        # Latest position of every axis in -1..1 keyed by axis id, updated from input events
+        self._axis_values = {}
+        # Axis ids of the sticks and the matching mixer, see _set_stick_axes
+        self._set_stick_axes(None, None, None)
+        # True while the last stick update asked for a non-zero track speed
+        self._driving = False
+        # time.monotonic() of the last track speed update, re-sends are scheduled from it
+        self._last_drive = 0.0
+        # (left track, right track) last sent to the motors
+        self._last_sent = (0.0, 0.0)
+        # Prints input loop errors, rate-limited so a failing device cannot flood the console
+        self._report_error = ErrorReporter()
+        # Kernel event time to handled, for the newest evdev report, in milliseconds
+        self.input_latency_ms = None
+        
+        if not self._init_evdev():
+            self._init_pygame()
+            
+        # Button and axis states
+        # Bit N is set while button N is held; an int is swapped whole, so it needs no lock
+        self.buttons_held = 0
+        # Held briefly around axis updates so get_status never sees a half-written update
+        self._state_lock = threading.Lock()
+        self.axis_states = {
+            'left_stick_y': 0.0,
+            'right_stick_y': 0.0,
+            'left_track': 0.0,
+            'right_track': 0.0
+        }
         
-        # Initialize pygame
+        # Deadzone for analog sticks
+        self.deadzone = 0.1
+        # Scale for the range left outside the deadzone, precomputed for _apply_deadzone
+        self._inv_one_minus_dz = 1.0 / (1.0 - self.deadzone)
+
+    def _init_evdev(self):
+        """Open the first evdev device with gamepad buttons, returns False if there is none"""
+        if InputDevice is None:
+            return False
         try:
+            for path in list_devices():
+                device = InputDevice(path)
+                keys = device.capabilities().get(ecodes.EV_KEY, [])
+                if ecodes.BTN_GAMEPAD in keys or ecodes.BTN_JOYSTICK in keys:
+                    self._setup_evdev(device)
+                    return True
+                device.close()
+            print("No evdev gamepad detected")
+        except Exception as e:
+            print(f"Error initializing evdev gamepad: {e}")
+        return False
+
+    def _setup_evdev(self, device):
+        """Build the button and axis tables for an evdev gamepad"""
+        capabilities = device.capabilities()
+        # Number buttons the way SDL does, so button indices match the pygame backend
+        keys = sorted(capabilities.get(ecodes.EV_KEY, []))
+        ordered = [code for code in keys if code >= ecodes.BTN_JOYSTICK] + \
+                  [code for code in keys if code < ecodes.BTN_JOYSTICK]
+        self._evdev_buttons = {code: index for index, code in enumerate(ordered)}
+        
+        # (minimum, scale) mapping each axis' raw range onto -1..1
+        self._evdev_axes = {}
+        for code, info in capabilities.get(ecodes.EV_ABS, []):
+            if info.max > info.min:
+                scale = 2.0 / (info.max - info.min)
+                self._evdev_axes[code] = (info.min, scale)
+                self._axis_values[code] = (info.value - info.min) * scale - 1.0
+        right_stick_y = ecodes.ABS_RY if ecodes.ABS_RY in self._evdev_axes else None
+        self._set_stick_axes(ecodes.ABS_X, ecodes.ABS_Y, right_stick_y)
+        
+        self.gamepad = device
+        self.gamepad_name = device.name
+        self.backend = 'evdev'
+        print(f"Gamepad connected: {device.name} ({device.path})")
+
+    def _init_pygame(self):
+        """Fall back to SDL joystick support through pygame"""
+        try:
+            # SDL's event queue needs a video driver, the dummy one provides it without
+            # opening a window or touching X11/KMS
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+            import pygame
             pygame.init()
             pygame.joystick.init()
-            # Initialize pygame display to avoid "video system not initialized" error
-            try:
-                pygame.display.init()
-                # Create a minimal display surface
-                pygame.display.set_mode((1, 1), pygame.NOFRAME)
-            except:
-                # If display init fails, continue without it
-                pass
             
             self.pygame_initialized = True
             print(f"Number of joysticks: {pygame.joystick.get_count()}")
@@ -40,20 +164,18 @@ class GamepadController:
             if pygame.joystick.get_count() > 0:
                 self.gamepad = pygame.joystick.Joystick(0)
                 self.gamepad.init()
-                print(f"Gamepad connected: {self.gamepad.get_name()}")
+                self.gamepad_name = self.gamepad.get_name()
+                self.backend = 'pygame'
+                num_axes = self.gamepad.get_numaxes()
+                self._axis_values = {axis: self.gamepad.get_axis(axis) for axis in range(num_axes)}
+                self._set_stick_axes(0, 1, 4 if num_axes > 4 else None)
+                print(f"Gamepad connected: {self.gamepad_name}")
             else:
                 print("No gamepad detected")
                 
         except Exception as e:
             print(f"Error initializing gamepad: {e}")
             self.pygame_initialized = False
-            
-        # Button and axis states
-        self.button_states = {}
-        self.axis_states = {}
-        
-        # Deadzone for analog sticks
-        self.deadzone = 0.1
 
     def start(self):
         """Start gamepad input thread"""
@@ -82,161 +204,272 @@ class GamepadController:
         """Apply deadzone to analog stick values"""
         if deadzone is None:
             deadzone = self.deadzone
+            scale = self._inv_one_minus_dz
+        else:
+            scale = 1.0 / (1.0 - deadzone)
         
-        if abs(value) < deadzone:
-            return 0.0
+        # Only one of the two terms is non-zero outside the deadzone and both are
+        # zero inside it; the remaining range is scaled back to -1 to 1
+        return (max(value - deadzone, 0.0) + min(value + deadzone, 0.0)) * scale
+
+    def _apply_radial_deadzone(self, x, y):
+        """Apply the deadzone to the length of a stick's (x, y) vector, keeping its direction"""
+        magnitude = math.hypot(x, y)
+        if magnitude <= self.deadzone:
+            return 0.0, 0.0
+        # Shrink the vector by the deadzone, then stretch the rest back to full range
+        scale = (magnitude - self.deadzone) * self._inv_one_minus_dz / magnitude
+        return x * scale, y * scale
+
+    def _input_loop(self):
+        """Main input processing loop, sleeps until the gamepad reports a change"""
+        # Stick changes should reach the motors even while the camera keeps the CPU busy
+        set_realtime_priority('Gamepad input')
         
-        # Scale the remaining range to -1 to 1
-        if value > 0:
-            return (value - deadzone) / (1.0 - deadzone)
+        if self.backend == 'evdev':
+            self._evdev_input_loop()
+        elif self.pygame_initialized:
+            self._pygame_input_loop()
         else:
-            return (value + deadzone) / (1.0 - deadzone)
+            print("No gamepad backend initialized, skipping input loop")
 
-    def _input_loop(self):
-        """Main input processing loop"""
-        if not self.pygame_initialized:
-            print("Pygame not initialized, skipping input loop")
-            return
-            
-        clock = pygame.time.Clock()
+    def _evdev_input_loop(self):
+        """Read kernel input events, driving the motors once per drained batch of reports"""
+        device = self.gamepad
+        # The tables are fixed for the device, look them up once rather than per event
+        axis_ranges = self._evdev_axes
+        axis_values = self._axis_values
+        buttons = self._evdev_buttons
+        axes_changed = False
+        while self.running:
+            try:
+                # Block on the device node, the timeout only bounds how long stop() waits
+                readable, _, _ = select.select([device.fd], [], [], self._wait_ms() / 1000.0)
+                if not readable:
+                    if self._driving:
+                        self._drive_from_sticks()
+                    continue
+                
+                report_ready = False
+                report_time = None
+                presses = []
+                for event in self._read_pending(device):
+                    if event.type == ecodes.EV_ABS:
+                        axis = axis_ranges.get(event.code)
+                        if axis is not None:
+                            axis_values[event.code] = (event.value - axis[0]) * axis[1] - 1.0
+                            axes_changed = True
+                    elif event.type == ecodes.EV_KEY:
+                        button = buttons.get(event.code)
+                        # Value 2 is key autorepeat, not a new press
+                        if button is not None and event.value != 2:
+                            if self._set_button(button, event.value == 1):
+                                presses.append(button)
+                    elif event.type == ecodes.EV_SYN and event.code == ecodes.SYN_REPORT:
+                        report_time = event.timestamp()
+                        # Axis values are only consistent at the end of a report
+                        if axes_changed:
+                            report_ready = True
+                            axes_changed = False
+                
+                # Only the newest complete report is sent to the motors, ahead of
+                # the slower crane moves so the tracks never wait behind a servo
+                if report_ready:
+                    self._drive_from_sticks()
+                for button in presses:
+                    self._handle_button_press(button)
+                if report_time is not None:
+                    # Input events carry the kernel's wall-clock time of the interrupt
+                    self.input_latency_ms = round((time.time() - report_time) * 1000.0, 1)
+                
+            except OSError as e:
+                # The device node goes away when the gamepad is unplugged
+                print(f"Gamepad disconnected: {e}")
+                self.gamepad = None
+                self.motor_control.stop()
+                break
+            except Exception as e:
+                self._report_error(f"Error in gamepad input loop: {e}")
+                time.sleep(0.1)
+
+    def _read_pending(self, device):
+        """Every event queued on the device, a single read() returns at most 64"""
+        events = list(device.read())
+        while select.select([device.fd], [], [], 0)[0]:
+            events.extend(device.read())
+        return events
+
+    def _pygame_input_loop(self):
+        """Wait for SDL joystick events, driving the motors once per burst"""
+        import pygame
+        
+        # Only joystick events are of interest, keep everything else out of the queue
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP])
         
         while self.running:
             try:
-                pygame.event.pump()
+                # Block in SDL rather than polling, the timeout only bounds how long stop() waits
+                event = pygame.event.wait(self._wait_ms())
+                if event.type == pygame.NOEVENT:
+                    if self._driving:
+                        self._drive_from_sticks()
+                    continue
                 
-                if self.gamepad:
-                    # Read analog sticks for tank-style control
-                    left_stick_y = self.gamepad.get_axis(1)   # Left stick Y-axis
-                    right_stick_y = self.gamepad.get_axis(4) if self.gamepad.get_numaxes() > 4 else 0  # Right stick Y-axis (if available)
-                    
-                    # Apply deadzone
-                    left_stick_y = self._apply_deadzone(left_stick_y)
-                    
-                    # If no right stick, use left stick X for turning
-                    if self.gamepad.get_numaxes() < 5:
-                        left_stick_x = self.gamepad.get_axis(0)  # Left stick X-axis
-                        left_stick_x = self._apply_deadzone(left_stick_x)
-                        
-                        # Tank-style control: forward/back + turning
-                        left_track = left_stick_y - left_stick_x
-                        right_track = left_stick_y + left_stick_x
-                        
-                        # Normalize values
-                        max_val = max(abs(left_track), abs(right_track), 1.0)
-                        left_track /= max_val
-                        right_track /= max_val
-                    else:
-                        # Dual stick tank control
-                        right_stick_y = self._apply_deadzone(right_stick_y)
-                        left_track = left_stick_y
-                        right_track = right_stick_y
-                        right_track = right_stick_y
-                    
-                    # Send to motor control
-                    self.motor_control.handle_gamepad_input(left_track, right_track)
-                    
-                    # Update axis states
-                    self.axis_states = {
-                        'left_stick_y': left_stick_y,
-                        'right_stick_y': right_stick_y if 'right_stick_y' in locals() else 0,
-                        'left_track': left_track,
-                        'right_track': right_track
-                    }
-                    
-                    # Read buttons
-                    button_count = self.gamepad.get_numbuttons()
-                    for i in range(button_count):
-                        self.button_states[f'button_{i}'] = self.gamepad.get_button(i)
-                    
-                    # Handle specific button actions
-                    if self.button_states.get('button_0', False):  # A button (stop)
-                        self.motor_control.stop()
-                    
-                    # Crane and grabber controls
-                    # Button 1 (B): Crane up
-                    if self.button_states.get('button_1', False):
-                        self.crane_control.lift_crane()
-                    
-                    # Button 2 (X): Crane down  
-                    if self.button_states.get('button_2', False):
-                        self.crane_control.lower_crane()
-                    
-                    # Button 3 (Y): Grabber open/close toggle
-                    if self.button_states.get('button_3', False) and not self.button_states.get('button_3_prev', False):
-                        # Toggle grabber on button press (not hold)
-                        current_status = self.crane_control.get_status()
-                        if current_status['grabber_position'] == 'open':
-                            self.crane_control.close_grabber()
-                        else:
-                            self.crane_control.open_grabber()
-                    
-                    # Shoulder buttons for alternative crane controls
-                    # Left bumper (button 4): Crane up
-                    if self.button_states.get('button_4', False):
-                        self.crane_control.lift_crane()
-                    
-                    # Right bumper (button 5): Crane down
-                    if self.button_states.get('button_5', False):
-                        self.crane_control.lower_crane()
-                    
-                    # Left trigger (button 6): Open grabber
-                    if self.button_states.get('button_6', False):
-                        self.crane_control.open_grabber()
-                    
-                    # Right trigger (button 7): Close grabber
-                    if self.button_states.get('button_7', False):
-                        self.crane_control.close_grabber()
-                    
-                    # Store previous button states for toggle detection
-                    for button_name in self.button_states:
-                        if not button_name.endswith('_prev'):
-                            self.button_states[f'{button_name}_prev'] = self.button_states.get(button_name, False)
+                axes_changed = False
+                presses = []
+                for event in [event] + pygame.event.get():
+                    if event.type == pygame.JOYAXISMOTION:
+                        # Only the newest value per axis matters, no need to query SDL again
+                        self._axis_values[event.axis] = event.value
+                        axes_changed = True
+                    elif event.type == pygame.JOYBUTTONDOWN:
+                        if self._set_button(event.button, True):
+                            presses.append(event.button)
+                    elif event.type == pygame.JOYBUTTONUP:
+                        self._set_button(event.button, False)
                 
-                clock.tick(60)  # 60 FPS
+                # A whole burst of stick events only needs one motor update
+                if axes_changed and self.gamepad:
+                    self._drive_from_sticks()
+                for button in presses:
+                    self._handle_button_press(button)
                 
             except Exception as e:
-                print(f"Error in gamepad input loop: {e}")
+                self._report_error(f"Error in gamepad input loop: {e}")
                 time.sleep(0.1)
 
+    def _set_button(self, button, pressed):
+        """Record a button change, returns True for a new press whose action should run"""
+        bit = 1 << button
+        # A repeated down event for a button already held must not re-run its action
+        if bool(self.buttons_held & bit) == pressed:
+            return False
+        self.buttons_held ^= bit
+        return pressed
+
+    def _wait_ms(self):
+        """How long to wait for input, while driving only until the next re-send is due"""
+        if not self._driving:
+            return INPUT_WAIT_MS
+        # Counted from the last update rather than from now, so the time spent handling
+        # events does not stretch the re-send period
+        remaining = self._last_drive + DRIVE_RESEND_MS / 1000.0 - time.monotonic()
+        return max(1, math.ceil(remaining * 1000.0))
+
+    def _set_stick_axes(self, left_x, left_y, right_y):
+        """Pick the stick axes and mixer once per gamepad, right_y is None without a right stick"""
+        self._left_x_axis = left_x
+        self._left_y_axis = left_y
+        self._right_y_axis = right_y
+        self._mix_sticks = self._mix_single_stick if right_y is None else self._mix_dual_stick
+
+    def _mix_single_stick(self):
+        """Left stick Y drives and X turns, returns (left y, right y, left track, right track)"""
+        axes = self._axis_values
+        # One stick steers in both directions, so its deadzone is a circle
+        # rather than a cross that swallows small diagonal moves
+        left_stick_x, left_stick_y = self._apply_radial_deadzone(
+            axes.get(self._left_x_axis, 0.0), axes.get(self._left_y_axis, 0.0))
+        
+        # Tank-style control: forward/back + turning
+        left_track = left_stick_y - left_stick_x
+        right_track = left_stick_y + left_stick_x
+        
+        # Normalize values
+        max_val = max(abs(left_track), abs(right_track), 1.0)
+        return left_stick_y, 0.0, left_track / max_val, right_track / max_val
+
+    def _mix_dual_stick(self):
+        """Each stick's Y drives its own track, returns (left y, right y, left track, right track)"""
+        axes = self._axis_values
+        left_stick_y = self._apply_deadzone(axes.get(self._left_y_axis, 0.0))
+        right_stick_y = self._apply_deadzone(axes.get(self._right_y_axis, 0.0))
+        return left_stick_y, right_stick_y, left_stick_y, right_stick_y
+
+    def _drive_from_sticks(self):
+        """Read the analog sticks and send tank-style track speeds to the motors"""
+        left_stick_y, right_stick_y, left_track, right_track = self._mix_sticks()
+        
+        # A held A button keeps the tank stopped
+        if self.buttons_held & 1:
+            self.motor_control.stop()
+            self._driving = False
+            self._last_sent = (0.0, 0.0)
+        else:
+            self._driving = bool(left_track or right_track)
+            now = time.monotonic()
+            last_left, last_right = self._last_sent
+            # Stick jitter is not worth a motor write, but a centred stick always stops
+            # the motors exactly and a held one is re-sent now and then
+            if (abs(left_track - last_left) > MOTOR_UPDATE_THRESHOLD or
+                    abs(right_track - last_right) > MOTOR_UPDATE_THRESHOLD or
+                    (not self._driving and (last_left or last_right)) or
+                    now - self._last_drive >= DRIVE_RESEND_MS / 1000.0):
+                self._last_sent = (left_track, right_track)
+                self._last_drive = now
+                # Send to motor control
+                self.motor_control.handle_gamepad_input(left_track, right_track)
+        
+        # Update axis states
+        axis_states = self.axis_states
+        with self._state_lock:
+            axis_states['left_stick_y'] = left_stick_y
+            axis_states['right_stick_y'] = right_stick_y
+            axis_states['left_track'] = left_track
+            axis_states['right_track'] = right_track
+
+    def _handle_button_press(self, button):
+        """Run the action for a gamepad button that was just pressed"""
+        if button == 0:  # A button (stop)
+            self.motor_control.stop()
+        
+        # Crane and grabber controls
+        # Button 1 (B) or left bumper (button 4): Crane up
+        elif button in (1, 4):
+            self.crane_control.lift_crane()
+        
+        # Button 2 (X) or right bumper (button 5): Crane down
+        elif button in (2, 5):
+            self.crane_control.lower_crane()
+        
+        # Button 3 (Y): Grabber open/close toggle
+        elif button == 3:
+            self.crane_control.toggle_grabber()
+        
+        # Left trigger (button 6): Open grabber
+        elif button == 6:
+            self.crane_control.open_grabber()
+        
+        # Right trigger (button 7): Close grabber
+        elif button == 7:
+            self.crane_control.close_grabber()
+
     def handle_command(self, command):
         """Handle web-based commands"""
+        action = self._commands.get(command)
+        if action is None:
+            print(f"Unknown command: {command}")
+            return
         try:
-            # Tank movement commands
-            if command == 'forward':
-                self.motor_control.move_forward()
-            elif command == 'backward':
-                self.motor_control.move_backward()
-            elif command == 'left':
-                self.motor_control.turn_left()
-            elif command == 'right':
-                self.motor_control.turn_right()
-            elif command == 'stop':
-                self.motor_control.stop()
-            # Crane and grabber commands
-            elif command == 'crane_up':
-                self.crane_control.lift_crane()
-            elif command == 'crane_down':
-                self.crane_control.lower_crane()
-            elif command == 'grabber_open':
-                self.crane_control.open_grabber()
-            elif command == 'grabber_close':
-                self.crane_control.close_grabber()
-            elif command == 'crane_stop':
-                self.crane_control.stop_crane()
-            elif command == 'grabber_stop':
-                self.crane_control.stop_grabber()
-            else:
-                print(f"Unknown command: {command}")
+            action()
         except Exception as e:
             print(f"Error handling command {command}: {e}")
 
     def get_status(self):
         """Get current gamepad and motor status"""
+        # Snapshot the axes, the input thread keeps updating them in place
+        with self._state_lock:
+            axis_states = dict(self.axis_states)
+        buttons_held = self.buttons_held
+        
         status = {
             'gamepad_connected': self.gamepad is not None,
-            'gamepad_name': self.gamepad.get_name() if self.gamepad else None,
-            'button_states': self.button_states,
-            'axis_states': self.axis_states,
+            'gamepad_name': self.gamepad_name if self.gamepad else None,
+            'gamepad_backend': self.backend,
+            'input_latency_ms': self.input_latency_ms,
+            'button_states': {f'button_{i}': (buttons_held >> i) & 1 for i in range(MAX_BUTTONS)},
+            'axis_states': axis_states,
             'motor_speeds': {
                 'left': self.motor_control.current_left_speed,
                 'right': self.motor_control.current_right_speed
@@ -272,12 +505,16 @@ class GamepadController:
         
         try:
             if self.gamepad:
-                self.gamepad.quit()
+                if self.backend == 'evdev':
+                    self.gamepad.close()
+                else:
+                    self.gamepad.quit()
         except Exception as e:
             print(f"Error quitting gamepad: {e}")
         
         try:
             if self.pygame_initialized:
+                import pygame
                 pygame.quit()
         except Exception as e:
             print(f"Error quitting pygame: {e}")
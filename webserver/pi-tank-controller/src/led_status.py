@@ -8,6 +8,11 @@ import threading
 import time
 
 class StatusLEDs:
+    __slots__ = (
+        'enable_ws2812', 'led_type', 'hardware_version', 'current_status',
+        '_last_emitted',
+    )
+
     def __init__(self, enable_ws2812=True):
         """Initialize LED status system"""
         self.enable_ws2812 = enable_ws2812
@@ -18,6 +23,8 @@ class StatusLEDs:
             'camera': 'disconnected',
             'gamepad': 'disconnected'
         }
+        # (system, camera, gamepad) last shown, repeated statuses are not shown again
+        self._last_emitted = None
         
         # Try to initialize WS2812 LEDs if enabled
         if enable_ws2812:
@@ -78,7 +85,13 @@ class StatusLEDs:
         print("LED Celebration pattern")
     
     def _update_display(self):
-        """Update LED display based on current status"""
+        """Update LED display based on current status, only when it has changed"""
+        key = (self.current_status['system'], self.current_status['camera'],
+               self.current_status['gamepad'])
+        if key == self._last_emitted:
+            return
+        self._last_emitted = key
+        
         status_str = f"Status - System: {self.current_status['system']}, " \
                     f"Camera: {self.current_status['camera']}, " \
                     f"Gamepad: {self.current_status['gamepad']}"
@@ -3,14 +3,40 @@ Crane and Grabber Control Module for Freenove Tank Robot Kit
 Handles the crane lift and grabber servo controls
 """
 
+import math
 import time
 import threading
+from tank.realtime import set_realtime_priority
+from tank.error_report import ErrorReporter
 
 # Global instance tracking to prevent GPIO conflicts
 _active_crane_instance = None
 _instance_lock = threading.Lock()
 
+# Gradual moves advance the servo this many degrees per step
+SERVO_STEP_DEGREES = 2
+# Time between steps at speed 1
+SERVO_STEP_SECONDS = 0.02
+# Servos take a new pulse width once per frame (50 Hz for pigpio and gpiozero). The period is
+# rounded up to whole microseconds so faster moves never step quicker than the servo updates
+SERVO_FRAME_HZ = 50
+SERVO_FRAME_SECONDS = math.ceil(1000000 / SERVO_FRAME_HZ) / 1000000
+# Attribute holding each servo's current angle
+SERVO_ANGLE_ATTRS = {'crane': 'current_crane_angle', 'grabber': 'current_grabber_angle'}
+
+# Servo pulse widths at 0 and 180 degrees for the pigpio driver, in microseconds
+SERVO_MIN_US = 500
+SERVO_MAX_US = 2500
+SERVO_US_PER_DEGREE = (SERVO_MAX_US - SERVO_MIN_US) / 180.0
+
 class CraneControl:
+    __slots__ = (
+        'servo_driver', 'crane_min_angle', 'crane_max_angle', 'grabber_min_angle',
+        'grabber_max_angle', 'current_crane_angle', 'current_grabber_angle', 'debug',
+        '_is_primary_instance', '_written_angles', '_moves', '_move_condition',
+        '_move_thread', '_closing', '_report_error',
+    )
+
     def __init__(self):
         """Initialize crane control with servo management"""
         global _active_crane_instance
@@ -40,8 +66,21 @@ class CraneControl:
             self.current_crane_angle = 140   # Start in up position
             self.current_grabber_angle = 90  # Start in open position
             
-            # Control lock for thread safety
-            self.lock = threading.Lock()
+            # No lock around servo writes: once running, gradual moves only step on the
+            # servo thread, and close() stops that thread before parking the servos
+            
+            # Print every servo step, off by default to keep gradual moves quiet
+            self.debug = False
+            # Angle last sent to each servo, so repeated angles are not re-sent
+            self._written_angles = {}
+            self._report_error = ErrorReporter()
+            
+            # Gradual moves in progress, servo name -> [target angle, step delay, next step time],
+            # stepped by a servo thread so callers never wait for a move to finish
+            self._moves = {}
+            self._move_condition = threading.Condition()
+            self._move_thread = None
+            self._closing = False
               # Set initial positions
             self.set_crane_angle(self.current_crane_angle)
             self.set_grabber_angle(self.current_grabber_angle)
@@ -58,8 +97,28 @@ class CraneControl:
 
     def _initialize_servo_driver(self):
         """Initialize the appropriate servo driver based on system capabilities"""
+        # pigpio times the pulses in its daemon with DMA, so the servos don't
+        # jitter when the CPU is busy; it needs pigpiod running
         try:
-            # Try to import gpiozero first (most compatible)
+            import pigpio
+            pi = pigpio.pi()
+            if pi.connected:
+                print("Using pigpio servo driver")
+                return {
+                    'crane': 7,    # GPIO 7 for servo 0 (crane lift)
+                    'grabber': 8,  # GPIO 8 for servo 1 (grabber)
+                    'pi': pi,
+                    'type': 'pigpio'
+                }
+            pi.stop()
+            print("pigpio daemon not running, trying gpiozero")
+        except ImportError:
+            pass
+        except Exception as e:
+            print(f"Error initializing pigpio servo driver: {e}")
+        
+        try:
+            # Fall back to gpiozero (most compatible)
             from gpiozero import AngularServo
             
             # PCB v1 GPIO pins for servos
@@ -108,47 +167,49 @@ class CraneControl:
         """Ensure angle is within specified range"""
         return max(min_angle, min(max_angle, angle))
 
+    def _write_servo(self, servo, angle):
+        """Send an angle to a servo, skipping it when the servo is already there"""
+        last_angle = self._written_angles.get(servo)
+        if last_angle is not None and abs(angle - last_angle) < 0.5:
+            return
+        driver = self.servo_driver
+        if driver['type'] == 'pigpio':
+            driver['pi'].set_servo_pulsewidth(driver[servo], SERVO_MIN_US + angle * SERVO_US_PER_DEGREE)
+        elif driver['type'] == 'gpiozero':
+            driver[servo].angle = angle
+        self._written_angles[servo] = angle
+
+    def _set_servo_angle(self, servo, angle):
+        """Move a servo to an angle already within its limits, returns False on failure"""
+        try:
+            self._write_servo(servo, angle)
+            
+            setattr(self, SERVO_ANGLE_ATTRS[servo], angle)
+            if self.debug:
+                print(f"{servo.capitalize()} angle set to {angle}°")
+            return True
+            
+        except Exception as e:
+            self._report_error(f"Error setting {servo} angle: {e}")
+            return False
+
     def set_crane_angle(self, angle):
         """Set crane lift angle (90=down, 150=up)"""
         if not self.servo_driver:
             print("No servo driver available")
             return False
-            
-        with self.lock:
-            try:
-                angle = self._ensure_angle_range(angle, self.crane_min_angle, self.crane_max_angle)
-                
-                if self.servo_driver['type'] == 'gpiozero':
-                    self.servo_driver['crane'].angle = angle
-                
-                self.current_crane_angle = angle
-                print(f"Crane angle set to {angle}°")
-                return True
-                
-            except Exception as e:
-                print(f"Error setting crane angle: {e}")
-                return False
+        
+        angle = self._ensure_angle_range(angle, self.crane_min_angle, self.crane_max_angle)
+        return self._set_servo_angle('crane', angle)
 
     def set_grabber_angle(self, angle):
         """Set grabber angle (90=open, 150=closed)"""
         if not self.servo_driver:
             print("No servo driver available")
             return False
-            
-        with self.lock:
-            try:
-                angle = self._ensure_angle_range(angle, self.grabber_min_angle, self.grabber_max_angle)
-                
-                if self.servo_driver['type'] == 'gpiozero':
-                    self.servo_driver['grabber'].angle = angle
-                
-                self.current_grabber_angle = angle
-                print(f"Grabber angle set to {angle}°")
-                return True
-                
-            except Exception as e:
-                print(f"Error setting grabber angle: {e}")
-                return False
+        
+        angle = self._ensure_angle_range(angle, self.grabber_min_angle, self.grabber_max_angle)
+        return self._set_servo_angle('grabber', angle)
 
     def lift_crane(self, speed=1):
         """Lift crane up gradually"""
@@ -156,7 +217,7 @@ class CraneControl:
             return False
             
         target_angle = self.crane_max_angle
-        return self._move_crane_gradually(target_angle, speed)
+        return self._start_move('crane', target_angle, speed)
 
     def lower_crane(self, speed=1):
         """Lower crane down gradually"""
@@ -164,7 +225,7 @@ class CraneControl:
             return False
             
         target_angle = self.crane_min_angle
-        return self._move_crane_gradually(target_angle, speed)
+        return self._start_move('crane', target_angle, speed)
 
     def open_grabber(self, speed=1):
         """Open grabber gradually"""
@@ -172,7 +233,7 @@ class CraneControl:
             return False
             
         target_angle = self.grabber_min_angle
-        return self._move_grabber_gradually(target_angle, speed)
+        return self._start_move('grabber', target_angle, speed)
 
     def close_grabber(self, speed=1):
         """Close grabber gradually"""
@@ -180,59 +241,80 @@ class CraneControl:
             return False
             
         target_angle = self.grabber_max_angle
-        return self._move_grabber_gradually(target_angle, speed)
+        return self._start_move('grabber', target_angle, speed)
 
-    def _move_crane_gradually(self, target_angle, speed):
-        """Move crane gradually to target angle"""
-        try:
-            current = self.current_crane_angle
-            step = 2 if target_angle > current else -2
-            delay = 0.02 / speed  # Adjust delay based on speed
-            
-            angles = range(int(current), int(target_angle) + step, step)
-            for angle in angles:
-                angle = self._ensure_angle_range(angle, self.crane_min_angle, self.crane_max_angle)
-                self.set_crane_angle(angle)
-                time.sleep(delay)
-            
-            # Ensure we reach exact target
-            self.set_crane_angle(target_angle)
-            return True
-            
-        except Exception as e:
-            print(f"Error moving crane gradually: {e}")
-            return False
+    def toggle_grabber(self, speed=1):
+        """Close an open grabber or open a closed one, going by where a move in progress is heading"""
+        with self._move_condition:
+            move = self._moves.get('grabber')
+            angle = move[0] if move else self.current_grabber_angle
+        if angle > 120:
+            return self.open_grabber(speed)
+        return self.close_grabber(speed)
 
-    def _move_grabber_gradually(self, target_angle, speed):
-        """Move grabber gradually to target angle"""
-        try:
-            current = self.current_grabber_angle
-            step = 2 if target_angle > current else -2
-            delay = 0.02 / speed  # Adjust delay based on speed
-            
-            angles = range(int(current), int(target_angle) + step, step)
-            for angle in angles:
-                angle = self._ensure_angle_range(angle, self.grabber_min_angle, self.grabber_max_angle)
-                self.set_grabber_angle(angle)
-                time.sleep(delay)
-            
-            # Ensure we reach exact target
-            self.set_grabber_angle(target_angle)
-            return True
+    def _start_move(self, servo, target_angle, speed):
+        """Hand a gradual move to the servo thread, replacing any move already running on that servo"""
+        with self._move_condition:
+            if self._closing:
+                return False
+            delay = max(SERVO_STEP_SECONDS / speed, SERVO_FRAME_SECONDS)
+            self._moves[servo] = [target_angle, delay, time.monotonic()]
+            if self._move_thread is None:
+                self._move_thread = threading.Thread(target=self._move_loop)
+                self._move_thread.daemon = True
+                self._move_thread.start()
+            self._move_condition.notify()
+        return True
+
+    def _cancel_move(self, servo):
+        """Stop a gradual move where it is"""
+        with self._move_condition:
+            self._moves.pop(servo, None)
+
+    def _move_loop(self):
+        """Step every servo with a move in progress, crane and grabber move at the same time"""
+        set_realtime_priority('Servo')
+        while True:
+            with self._move_condition:
+                while not self._moves and not self._closing:
+                    self._move_condition.wait()
+                if self._closing:
+                    return
+                now = time.monotonic()
+                due = [(servo, move[0]) for servo, move in self._moves.items() if move[2] <= now]
+                if not due:
+                    # Sleep until the next step, a new or cancelled move wakes us early
+                    self._move_condition.wait(min(move[2] for move in self._moves.values()) - now)
+                    continue
             
-        except Exception as e:
-            print(f"Error moving grabber gradually: {e}")
-            return False
+            for servo, target_angle in due:
+                current = getattr(self, SERVO_ANGLE_ATTRS[servo])
+                # Whole steps towards the target, then the exact target. Targets are
+                # always servo limits, so every step lies within them without clamping
+                remaining = target_angle - current
+                step = max(-SERVO_STEP_DEGREES, min(SERVO_STEP_DEGREES, remaining))
+                moved = self._set_servo_angle(servo, current + step)
+                
+                with self._move_condition:
+                    move = self._moves.get(servo)
+                    # Leave a move alone if it was replaced while this step ran
+                    if move is None or move[0] != target_angle:
+                        continue
+                    if not moved or abs(remaining) <= SERVO_STEP_DEGREES:
+                        del self._moves[servo]
+                    else:
+                        # Keep to the step rate without bursting to catch up after a slow step
+                        move[2] = max(move[2] + move[1], time.monotonic())
 
     def stop_crane(self):
         """Stop crane movement"""
-        # Servos don't need explicit stopping - they hold position
-        pass
+        # Servos hold position, only a gradual move in progress needs stopping
+        self._cancel_move('crane')
 
     def stop_grabber(self):
         """Stop grabber movement"""
-        # Servos don't need explicit stopping - they hold position  
-        pass
+        # Servos hold position, only a gradual move in progress needs stopping
+        self._cancel_move('grabber')
 
     def get_status(self):
         """Get current crane and grabber status"""
@@ -251,6 +333,7 @@ class CraneControl:
             'crane_down': self.lower_crane,
             'grabber_open': self.open_grabber,
             'grabber_close': self.close_grabber,
+            'grabber_toggle': self.toggle_grabber,
             'crane_stop': self.stop_crane,
             'grabber_stop': self.stop_grabber
         }
@@ -271,18 +354,33 @@ class CraneControl:
         global _active_crane_instance
         
         try:
+            # Finish with the servo thread before parking the servos
+            with self._move_condition:
+                self._closing = True
+                self._moves.clear()
+                self._move_condition.notify()
+            if self._move_thread:
+                self._move_thread.join(timeout=1.0)
+            
             # Only close servos if this is the primary instance
-            if self._is_primary_instance and self.servo_driver and self.servo_driver['type'] == 'gpiozero':
+            if self._is_primary_instance and self.servo_driver:
                 # Set servos to safe positions before closing
                 self.set_crane_angle(140)  # Up position
                 self.set_grabber_angle(90)  # Open position
                 time.sleep(0.5)
                 
-                # Close servo objects
-                if 'crane' in self.servo_driver:
-                    self.servo_driver['crane'].close()
-                if 'grabber' in self.servo_driver:
-                    self.servo_driver['grabber'].close()
+                if self.servo_driver['type'] == 'pigpio':
+                    # A pulse width of 0 switches the servo pulses off
+                    pi = self.servo_driver['pi']
+                    pi.set_servo_pulsewidth(self.servo_driver['crane'], 0)
+                    pi.set_servo_pulsewidth(self.servo_driver['grabber'], 0)
+                    pi.stop()
+                else:
+                    # Close servo objects
+                    if 'crane' in self.servo_driver:
+                        self.servo_driver['crane'].close()
+                    if 'grabber' in self.servo_driver:
+                        self.servo_driver['grabber'].close()
                     
                 # Clear the global instance
                 with _instance_lock:
@@ -0,0 +1,22 @@
+"""
+Rate-limited error printing for the control loops, which can fail on every iteration
+"""
+
+import time
+
+# A failing loop prints at most one error this often, in seconds
+ERROR_REPORT_SECONDS = 5.0
+
+class ErrorReporter:
+    """Callable that prints a message, at most once per ERROR_REPORT_SECONDS"""
+    __slots__ = ('_last_error_at',)
+
+    def __init__(self):
+        # time.monotonic() of the last error printed
+        self._last_error_at = float('-inf')
+
+    def __call__(self, message):
+        now = time.monotonic()
+        if now - self._last_error_at >= ERROR_REPORT_SECONDS:
+            self._last_error_at = now
+            print(message)
@@ -1,65 +1,164 @@
 import time
 import threading
+from tank.realtime import set_realtime_priority
+from tank.error_report import ErrorReporter
+
+# GPIO pins for tank motors based on Freenove Tank Robot Kit PCB v1, (forward, backward)
+LEFT_MOTOR_PINS = (23, 24)
+RIGHT_MOTOR_PINS = (6, 5)
+
+# PWM frequency for the pigpio driver, in Hz
+MOTOR_PWM_FREQUENCY = 1000
+
+# (left, right) track directions for each simple drive command
+DRIVE_COMMANDS = {
+    'forward': (1, 1),
+    'backward': (-1, -1),
+    'left': (-1, 1),
+    'right': (1, -1),
+    'stop': (0, 0),
+}
+
+# gpiozero speed (0-1) for each integer duty cycle magnitude
+DUTY_TO_SPEED = tuple(duty / 4095.0 for duty in range(4096))
 
 class TankMotorControl:
     def __init__(self):
         """Initialize tank motor control for Raspberry Pi 3 with PCB v1"""
+        self.pi = None
+        self.left_motor = None
+        self.right_motor = None
+        self.current_left_speed = 0
+        self.current_right_speed = 0
+        self.max_speed = 1.0  # Maximum speed (0-1 for gpiozero)
+        # Latest (left, right) duty request, handed to the motor thread through the event
+        self._target = (0, 0)
+        self._target_event = threading.Event()
+        self._motor_thread = None
+        self._closing = False
+        self._report_error = ErrorReporter()
+        
         try:
-            from gpiozero import Motor
-            # GPIO pins for tank motors based on Freenove Tank Robot Kit PCB v1
-            self.left_motor = Motor(23, 24)   # Left motor: forward=23, backward=24
-            self.right_motor = Motor(6, 5)    # Right motor: forward=6, backward=5
-            
-            self.current_left_speed = 0
-            self.current_right_speed = 0
-            self.max_speed = 1.0  # Maximum speed (0-1 for gpiozero)
-            self.lock = threading.Lock()
+            self.pi = self._init_pigpio()
+            if self.pi is None:
+                from gpiozero import Motor
+                self.left_motor = Motor(*LEFT_MOTOR_PINS)
+                self.right_motor = Motor(*RIGHT_MOTOR_PINS)
+                self._left_commands = self._motor_commands(self.left_motor)
+                self._right_commands = self._motor_commands(self.right_motor)
+                print("Using gpiozero motor driver")
+            self._motor_thread = threading.Thread(target=self._motor_loop, name='motor', daemon=True)
+            self._motor_thread.start()
             print("Tank motor control initialized successfully")
         except Exception as e:
             print(f"Error initializing motors: {e}")
             self.left_motor = None
             self.right_motor = None
 
+    def _init_pigpio(self):
+        """Connect to pigpiod and set up the motor pins, returns None when it is unavailable"""
+        try:
+            import pigpio
+        except ImportError:
+            return None
+        
+        pi = pigpio.pi()
+        if not pi.connected:
+            pi.stop()
+            print("pigpio daemon not running, trying gpiozero")
+            return None
+        
+        # DMA-timed PWM on any pin; a range of 4095 takes the duty values as they are
+        for pin in LEFT_MOTOR_PINS + RIGHT_MOTOR_PINS:
+            pi.set_mode(pin, pigpio.OUTPUT)
+            # pigpiod picks the nearest frequency its sample rate supports, report what we got
+            frequency = pi.set_PWM_frequency(pin, MOTOR_PWM_FREQUENCY)
+            if frequency != MOTOR_PWM_FREQUENCY:
+                print(f"Motor PWM on GPIO {pin} runs at {frequency} Hz instead of {MOTOR_PWM_FREQUENCY} Hz")
+            pi.set_PWM_range(pin, 4095)
+            pi.set_PWM_dutycycle(pin, 0)
+        print("Using pigpio motor driver")
+        return pi
+
+    def _motor_commands(self, motor):
+        """Bound (backward, stop, forward) methods of a gpiozero motor, each taking a speed"""
+        stop = motor.stop
+        return (motor.backward, lambda speed: stop(), motor.forward)
+
     def duty_range(self, duty1, duty2):
         """Ensure the duty cycle values are within the valid range (-4095 to 4095)"""
-        duty1 = max(-4095, min(4095, duty1))
-        duty2 = max(-4095, min(4095, duty2))
+        duty1 = -4095 if duty1 < -4095 else 4095 if duty1 > 4095 else duty1
+        duty2 = -4095 if duty2 < -4095 else 4095 if duty2 > 4095 else duty2
         return duty1, duty2
 
+    def _set_pigpio_motor(self, pins, duty):
+        """Drive one motor through pigpio, releasing the idle direction pin first"""
+        forward_pin, backward_pin = pins
+        if duty > 0:
+            self.pi.set_PWM_dutycycle(backward_pin, 0)
+            self.pi.set_PWM_dutycycle(forward_pin, duty)
+        else:
+            self.pi.set_PWM_dutycycle(forward_pin, 0)
+            self.pi.set_PWM_dutycycle(backward_pin, -duty)
+
     def set_motor_speeds(self, left_duty, right_duty):
-        """Set motor speeds with duty cycle values (-4095 to 4095)"""
-        if not self.left_motor or not self.right_motor:
+        """Set motor speeds with duty cycle values (-4095 to 4095), applied by the motor thread"""
+        # Same clamp as duty_range, inline to save a call and tuple per update. Duties are
+        # made whole numbers too, the motor thread indexes DUTY_TO_SPEED with them
+        left_duty = -4095 if left_duty < -4095 else 4095 if left_duty > 4095 else int(left_duty)
+        right_duty = -4095 if right_duty < -4095 else 4095 if right_duty > 4095 else int(right_duty)
+        target = (left_duty, right_duty)
+        if self._motor_thread is None:
             return
-            
-        with self.lock:
-            left_duty, right_duty = self.duty_range(left_duty, right_duty)
-            
-            # Convert duty cycle to speed percentage (0-1)
-            left_speed = abs(left_duty) / 4095.0
-            right_speed = abs(right_duty) / 4095.0
-            
+        # A stick held steady or a repeated command changes nothing, skip the GPIO writes.
+        # current_*_speed only changes once a write succeeds, so a failed write is retried
+        if (target == self._target and left_duty == self.current_left_speed
+                and right_duty == self.current_right_speed):
+            return
+        
+        # Replacing the tuple is atomic, the motor thread only ever applies the latest target
+        self._target = target
+        self._target_event.set()
+
+    def _motor_loop(self):
+        """Apply the newest target, the only thread that writes to the motor pins"""
+        set_realtime_priority('Motor')
+        while True:
+            self._target_event.wait()
+            self._target_event.clear()
+            # Read the flag before the target, so a stop() just before close() is still applied
+            closing = self._closing
+            left_duty, right_duty = self._target
+            if left_duty != self.current_left_speed or right_duty != self.current_right_speed:
+                self._apply_motor_speeds(left_duty, right_duty)
+            if closing:
+                return
+
+    def _apply_motor_speeds(self, left_duty, right_duty):
+        """Write clamped duty cycles to the motor driver"""
+        if self.pi is not None:
             try:
-                # Control left motor
-                if left_duty > 0:
-                    self.left_motor.forward(left_speed)
-                elif left_duty < 0:
-                    self.left_motor.backward(left_speed)
-                else:
-                    self.left_motor.stop()
-                
-                # Control right motor
-                if right_duty > 0:
-                    self.right_motor.forward(right_speed)
-                elif right_duty < 0:
-                    self.right_motor.backward(right_speed)
-                else:
-                    self.right_motor.stop()
-                    
+                self._set_pigpio_motor(LEFT_MOTOR_PINS, left_duty)
+                self._set_pigpio_motor(RIGHT_MOTOR_PINS, right_duty)
                 self.current_left_speed = left_duty
                 self.current_right_speed = right_duty
-                
             except Exception as e:
-                print(f"Error setting motor speeds: {e}")
+                self._report_error(f"Error setting motor speeds: {e}")
+            return
+        
+        try:
+            # Convert duty cycle to speed percentage (0-1)
+            left_speed = DUTY_TO_SPEED[left_duty if left_duty >= 0 else -left_duty]
+            right_speed = DUTY_TO_SPEED[right_duty if right_duty >= 0 else -right_duty]
+            
+            # Index by sign + 1: backward, stop or forward
+            self._left_commands[(left_duty > 0) - (left_duty < 0) + 1](left_speed)
+            self._right_commands[(right_duty > 0) - (right_duty < 0) + 1](right_speed)
+            self.current_left_speed = left_duty
+            self.current_right_speed = right_duty
+            
+        except Exception as e:
+            self._report_error(f"Error setting motor speeds: {e}")
 
     def move_forward(self, speed=2000):
         """Move tank forward"""
@@ -86,32 +185,28 @@ class TankMotorControl:
         left_stick_y: -1 to 1 (left track control)
         right_stick_y: -1 to 1 (right track control)
         """
-        # Convert stick values to motor duty cycles
-        left_duty = int(left_stick_y * 4095)
-        right_duty = int(right_stick_y * 4095)
-        
-        # Invert Y axis (gamepad up = positive, but we want positive = forward)
-        left_duty = -left_duty
-        right_duty = -right_duty
-        
-        self.set_motor_speeds(left_duty, right_duty)
+        # Convert stick values to motor duty cycles, inverting the Y axis in the same
+        # multiply (gamepad up = positive, but we want positive = forward)
+        self.set_motor_speeds(int(left_stick_y * -4095), int(right_stick_y * -4095))
 
-    def control_tank(self, command):
+    def control_tank(self, command, speed=2000):
         """Control tank with simple commands for compatibility"""
-        if command == 'forward':
-            self.move_forward()
-        elif command == 'backward':
-            self.move_backward()
-        elif command == 'left':
-            self.turn_left()
-        elif command == 'right':
-            self.turn_right()
-        elif command == 'stop':
-            self.stop()
+        direction = DRIVE_COMMANDS.get(command)
+        if direction is not None:
+            self.set_motor_speeds(direction[0] * speed, direction[1] * speed)
 
     def close(self):
         """Clean up motor resources"""
+        if self._motor_thread is not None:
+            self._closing = True
+            self._target_event.set()
+            self._motor_thread.join(timeout=1.0)
+            self._motor_thread = None
         try:
+            if self.pi is not None:
+                for pin in LEFT_MOTOR_PINS + RIGHT_MOTOR_PINS:
+                    self.pi.set_PWM_dutycycle(pin, 0)
+                self.pi.stop()
             if self.left_motor:
                 self.left_motor.close()
             if self.right_motor:
@@ -0,0 +1,21 @@
+"""
+Real-time scheduling for the threads that drive the motors and servos
+"""
+
+import os
+
+# SCHED_FIFO priority for control threads, above every normal thread but below kernel IRQ threads (50)
+CONTROL_THREAD_PRIORITY = 10
+
+def set_realtime_priority(name, priority=CONTROL_THREAD_PRIORITY):
+    """Move the calling thread to SCHED_FIFO, returns False where that is not permitted"""
+    if not hasattr(os, 'sched_setscheduler'):
+        return False
+    try:
+        # pid 0 is the calling thread on Linux
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+        print(f"{name} thread running at real-time priority {priority}")
+        return True
+    except OSError as e:
+        print(f"{name} thread keeps normal priority, real-time scheduling needs CAP_SYS_NICE: {e}")
+        return False
@@ -3,39 +3,42 @@
 Test camera stream functionality
 """
 
+import atexit
 import sys
 import os
-import time
+from functools import lru_cache
 
 # Add the src directory to the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from camera.stream import CameraStream
 
+@lru_cache(maxsize=1)
+def get_camera_stream():
+    """Started CameraStream shared by every camera test in this process, stopped at exit"""
+    camera = CameraStream()
+    # A placeholder frame is published before start(), wait for one newer than it
+    _, first_id = camera.latest_frame()
+    camera.start()
+    atexit.register(camera.stop)
+    
+    # Wait for capture to start, returning as soon as the first frame is published
+    camera.wait_frame(first_id, timeout=2.0)
+    return camera
+
 def test_camera_stream():
     print("Testing camera stream...")
     
-    # Create camera stream
-    camera = CameraStream()
+    # Create and start the camera stream, or reuse the one another test started
+    camera = get_camera_stream()
     print(f"Camera initialized: {camera.camera is not None}")
     print(f"Use fallback: {camera.use_fallback}")
-    
-    # Start streaming
-    camera.start()
     print(f"Streaming started: {camera.is_streaming}")
     
-    # Wait a moment for capture to start
-    time.sleep(2)
-    
     # Test getting frames
     for i in range(5):
-        frame = camera.get_frame()
+        frame = camera.get_frame(wait=True, timeout=0.5)
         print(f"Frame {i+1}: {'OK' if frame and len(frame) > 0 else 'EMPTY'} ({len(frame) if frame else 0} bytes)")
-        time.sleep(0.5)
-    
-    # Stop streaming
-    camera.stop()
-    print("Camera stream stopped")
 
 if __name__ == '__main__':
     test_camera_stream()
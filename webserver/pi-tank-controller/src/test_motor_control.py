@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test the motor thread in TankMotorControl against a fake pigpio daemon, no GPIO needed
+"""
+
+import sys
+import os
+import time
+import types
+
+# Add the src directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tank.motor_control import TankMotorControl, LEFT_MOTOR_PINS
+
+class FakePi:
+    """Stands in for pigpio.pi(), recording duty cycle writes"""
+    connected = True
+
+    def __init__(self):
+        self.writes = []
+        # Number of upcoming set_PWM_dutycycle calls that raise
+        self.fail_writes = 0
+        # Seconds each set_PWM_dutycycle call takes
+        self.write_delay = 0
+
+    def set_mode(self, pin, mode):
+        pass
+
+    def set_PWM_frequency(self, pin, frequency):
+        return frequency
+
+    def set_PWM_range(self, pin, value):
+        pass
+
+    def set_PWM_dutycycle(self, pin, duty):
+        time.sleep(self.write_delay)
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise IOError("fake pigpio write failed")
+        self.writes.append((pin, duty))
+
+    def stop(self):
+        pass
+
+def make_motor_control():
+    """TankMotorControl on a fake pigpio, returns (motor_control, fake_pi)"""
+    fake_pi = FakePi()
+    pigpio = types.ModuleType('pigpio')
+    pigpio.OUTPUT = 1
+    pigpio.pi = lambda: fake_pi
+    saved = sys.modules.get('pigpio')
+    sys.modules['pigpio'] = pigpio
+    try:
+        motor_control = TankMotorControl()
+    finally:
+        if saved is None:
+            del sys.modules['pigpio']
+        else:
+            sys.modules['pigpio'] = saved
+    fake_pi.writes.clear()
+    return motor_control, fake_pi
+
+class FakeMotor:
+    """Stands in for gpiozero.Motor, recording the last command"""
+    def __init__(self, forward_pin, backward_pin):
+        self.state = ('stop', 0)
+
+    def forward(self, speed=1):
+        self.state = ('forward', speed)
+
+    def backward(self, speed=1):
+        self.state = ('backward', speed)
+
+    def stop(self):
+        self.state = ('stop', 0)
+
+    def close(self):
+        pass
+
+def make_gpiozero_motor_control():
+    """TankMotorControl on fake gpiozero motors, with pigpio unavailable"""
+    gpiozero = types.ModuleType('gpiozero')
+    gpiozero.Motor = FakeMotor
+    saved = {name: sys.modules.get(name) for name in ('pigpio', 'gpiozero')}
+    # None in sys.modules makes the import raise ImportError
+    sys.modules['pigpio'] = None
+    sys.modules['gpiozero'] = gpiozero
+    try:
+        return TankMotorControl()
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                del sys.modules[name]
+            else:
+                sys.modules[name] = module
+
+def wait_until(condition, timeout=1.0):
+    """Poll condition() until it is true, returns its final value"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+def test_failed_write_is_retried():
+    motor_control, fake_pi = make_motor_control()
+    try:
+        fake_pi.fail_writes = 1
+        motor_control.set_motor_speeds(2000, 2000)
+        assert wait_until(lambda: fake_pi.fail_writes == 0)
+        time.sleep(0.05)
+        assert motor_control.current_left_speed == 0
+
+        # The same duties again, as the gamepad's periodic resend does
+        motor_control.set_motor_speeds(2000, 2000)
+        assert wait_until(lambda: motor_control.current_left_speed == 2000)
+        assert (LEFT_MOTOR_PINS[0], 2000) in fake_pi.writes
+    finally:
+        motor_control.close()
+
+def test_stop_before_close_is_applied():
+    motor_control, fake_pi = make_motor_control()
+    # Slow writes keep the motor thread busy while stop() and close() arrive
+    fake_pi.write_delay = 0.02
+    motor_control.set_motor_speeds(2000, 2000)
+    assert wait_until(lambda: fake_pi.writes)
+    motor_control.stop()
+    motor_control.close()
+    assert motor_control.current_left_speed == 0
+    assert motor_control.current_right_speed == 0
+
+def test_float_duty_is_applied():
+    motor_control = make_gpiozero_motor_control()
+    try:
+        motor_control.set_motor_speeds(1500.0, -4095.0)
+        assert wait_until(lambda: motor_control.current_left_speed == 1500)
+        assert motor_control.left_motor.state == ('forward', 1500 / 4095.0)
+        assert motor_control.right_motor.state == ('backward', 1.0)
+        assert motor_control._motor_thread.is_alive()
+    finally:
+        motor_control.close()
+
+if __name__ == '__main__':
+    test_failed_write_is_retried()
+    test_stop_before_close_is_applied()
+    test_float_duty_is_applied()
+    print("Motor control tests passed")
@@ -64,6 +64,6 @@ echo "Press Ctrl+C to stop the server"
 echo "========================================"
 echo ""
 
-# Start the Flask application
+# Start the FastAPI application
 cd src
 python app.py
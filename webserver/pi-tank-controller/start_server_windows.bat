@@ -21,7 +21,7 @@ call venv\Scripts\activate.bat
 
 REM Install/update dependencies (skip hardware-specific ones on Windows)
 echo Installing dependencies...
-pip install Flask==2.3.3 opencv-python==4.8.1.78 pygame==2.5.2 numpy==1.24.3
+pip install fastapi==0.110.0 "uvicorn[standard]==0.27.1" Jinja2==3.1.2 opencv-python==4.8.1.78 pygame==2.5.2 numpy==1.24.3
 
 echo.
 echo === Starting Tank Controller Web Server (Test Mode) ===
@@ -39,7 +39,7 @@ echo Press Ctrl+C to stop the server
 echo ==========================================
 echo.
 
-REM Start the Flask application
+REM Start the FastAPI application
 cd src
 python app.py
 
@@ -7,10 +7,100 @@ class TankController {
         this.commandCooldown = 50; // ms
         this.deadzone = 0.1;
         this.yButtonPressed = false; // For grabber toggle
+        this.socket = null;
         
+        this.connectSocket();
         this.initializeEventListeners();
         this.startGamepadPolling();
         this.updateStatus();
+        
+        // Slow links can pull single frames instead of the MJPEG push stream: ?snapshot&fps=10
+        const params = new URLSearchParams(window.location.search);
+        if (params.has('snapshot')) {
+            this.startSnapshotStream(parseInt(params.get('fps')) || 15);
+        } else if (params.has('h264')) {
+            this.startH264Stream();
+        }
+    }
+
+    startH264Stream() {
+        // Swap the MJPEG image for a video element playing the hardware H.264 stream
+        const img = document.getElementById('stream');
+        const video = document.createElement('video');
+        video.id = 'stream';
+        video.autoplay = true;
+        video.muted = true;
+        video.playsInline = true;
+        video.src = '/video.mp4';
+        // Fall back to MJPEG if H.264 is unavailable or already in use
+        video.onerror = () => {
+            img.src = '/video_feed';
+            video.replaceWith(img);
+        };
+        img.src = '';
+        img.replaceWith(video);
+    }
+
+    startSnapshotStream(targetFps) {
+        const img = document.getElementById('stream');
+        const minInterval = 1000 / targetFps;
+        let requestedAt = 0;
+        
+        const requestFrame = () => {
+            requestedAt = Date.now();
+            img.src = '/snapshot?t=' + requestedAt;
+        };
+        
+        // Only ask for the next frame once the previous one has loaded, capped at targetFps
+        img.onload = () => {
+            setTimeout(requestFrame, Math.max(0, minInterval - (Date.now() - requestedAt)));
+        };
+        img.onerror = () => setTimeout(requestFrame, 1000);
+        requestFrame();
+    }
+
+    connectSocket() {
+        // Control messages share one open connection; HTTP /api is used while it is down
+        const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+        const socket = new WebSocket(protocol + window.location.host + '/ws');
+        
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.kind === 'status') {
+                this.showStatus(data);
+            } else if (data.status !== 'success') {
+                console.error('Command failed:', data.message);
+            }
+        };
+        socket.onclose = () => {
+            this.socket = null;
+            setTimeout(() => this.connectSocket(), 1000);
+        };
+        this.socket = socket;
+    }
+
+    sendControl(message, label) {
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify(message));
+            return;
+        }
+        
+        fetch('/api', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(message),
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success') {
+                console.error(label + ' failed:', data.message);
+            }
+        })
+        .catch(error => {
+            console.error('Error sending ' + label.toLowerCase() + ':', error);
+        });
     }
 
     initializeEventListeners() {
@@ -248,57 +338,19 @@ class TankController {
     }
 
     sendCommand(command) {
-        fetch('/control', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ command: command }),
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.status !== 'success') {
-                console.error('Command failed:', data.message);
-            }
-        })
-        .catch(error => {
-            console.error('Error sending command:', error);
-        });
+        this.sendControl({ kind: 'cmd', command: command }, 'Command');
     }
 
     sendCraneCommand(command) {
-        fetch('/crane_control', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ command: command }),
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.status !== 'success') {
-                console.error('Crane command failed:', data.message);
-            }
-        })
-        .catch(error => {
-            console.error('Error sending crane command:', error);
-        });
+        this.sendControl({ kind: 'crane', command: command }, 'Crane command');
     }
 
     sendGamepadControl(leftStickY, rightStickY) {
-        fetch('/gamepad_control', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                left_stick_y: leftStickY,
-                right_stick_y: rightStickY
-            }),
-        })
-        .catch(error => {
-            console.error('Error sending gamepad control:', error);
-        });
+        this.sendControl({
+            kind: 'sticks',
+            left_stick_y: leftStickY,
+            right_stick_y: rightStickY
+        }, 'Gamepad control');
     }
 
     updateGamepadStatus() {
@@ -327,35 +379,39 @@ class TankController {
     }
 
     updateStatus() {
-        fetch('/status')
-            .then(response => response.json())
-            .then(data => {
-                document.getElementById('camera-status').textContent = 
-                    data.camera_streaming ? 'Active ✅' : 'Inactive ❌';
-                
-                if (data.gamepad_status && data.gamepad_status.motor_speeds) {
-                    document.getElementById('motor-left').textContent = 
-                        data.gamepad_status.motor_speeds.left || 0;
-                    document.getElementById('motor-right').textContent = 
-                        data.gamepad_status.motor_speeds.right || 0;
-                }
-                
-                // Update crane status if available
-                if (data.gamepad_status && data.gamepad_status.crane_status) {
-                    const craneStatus = data.gamepad_status.crane_status;
-                    document.getElementById('crane-position').textContent = 
-                        craneStatus.crane_position || 'Unknown';
-                    document.getElementById('grabber-position').textContent = 
-                        craneStatus.grabber_position || 'Unknown';
-                }
-            })
-            .catch(error => {
-                console.error('Error updating status:', error);
-            });
-        
-        // Update status every 2 seconds
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify({ kind: 'status' }));
+        } else {
+            fetch('/status')
+                .then(response => response.json())
+                .then(data => this.showStatus(data))
+                .catch(error => {
+                    console.error('Error updating status:', error);
+                });
+        }
         setTimeout(() => this.updateStatus(), 2000);
     }
+
+    showStatus(data) {
+        document.getElementById('camera-status').textContent = 
+            data.camera_streaming ? 'Active ✅' : 'Inactive ❌';
+        
+        if (data.gamepad_status && data.gamepad_status.motor_speeds) {
+            document.getElementById('motor-left').textContent = 
+                data.gamepad_status.motor_speeds.left || 0;
+            document.getElementById('motor-right').textContent = 
+                data.gamepad_status.motor_speeds.right || 0;
+        }
+        
+        // Update crane status if available
+        if (data.gamepad_status && data.gamepad_status.crane_status) {
+            const craneStatus = data.gamepad_status.crane_status;
+            document.getElementById('crane-position').textContent = 
+                craneStatus.crane_position || 'Unknown';
+            document.getElementById('grabber-position').textContent = 
+                craneStatus.grabber_position || 'Unknown';
+        }
+    }
 }
 
 // Initialize the tank controller when the page loads